@@ -1,33 +1,82 @@
+# The profiler has to start before the other imports to time them
+import startup
+profiler = startup.start_profiler()
+
+import json
+import os
+from concurrent.futures import CancelledError
 import dash
-from dash.dependencies import Input, Output, State
-import pandas as pd
+import flask
+from dash.dependencies import Input, Output, State, ClientsideFunction
+from dash.exceptions import PreventUpdate
 import numpy as np
 from graph_generation.graph_generation import generate_graph
-from graph_generation.interaction import filter_data, select, flip_axes
-from graph_generation.exploration import cluster
+from graph_generation.interaction import FilterIndex, filter_data, flip_axes
+from graph_generation.exploration import cluster, cluster_model
+from graph_generation import exploration, regression
+from graph_generation.statistics import PairwiseStatistics
+from graph_generation.linked import GroupSummary
+from graph_generation.serialization import encode_figure
+from graph_generation.session import get_selection, selection_version
+from graph_generation.cache import LRUCache, make_key
+from data_processing.loading import load_dataset
+from data_processing.catalog import build_catalog, columns_of_kind, options
 from layout import generate_layout
-
-
-# Read the data
-df = pd.read_excel('data/dataset.xlsx', engine='openpyxl').dropna(how="all", axis=1)
-# Preprocess the data
-df = df.iloc[df["Red blood Cells"].dropna().index, :]
-df['select'] = False
-df["COVID-19"] = pd.get_dummies(df['SARS-Cov-2 exam result'], drop_first=True)
+from instrumentation import Instrumentation, panel_enabled
+from jobs import JobManager, Cancelled, background_enabled
+
+
+# Read the preprocessed data (the columnar cache is rebuilt when the workbook changes)
+# The dataframe is shared by all sessions and is never modified, per user state lives in the session store
+df, statistics = load_dataset()
+# Metadata of every column, the option and slider callbacks answer from it instead of scanning the data
+catalog = build_catalog(df, statistics)
+float_options = options(columns_of_kind(catalog, "float"))
+strip_options = options(columns_of_kind(catalog, "int") + columns_of_kind(catalog, "object"))
+# Sorted column indexes for the filter, built lazily and shared by all requests
+filter_index = FilterIndex(df, catalog)
+# Correlations of the float columns, computed once here and updated from per-bucket sums when a filter is applied
+pair_statistics = PairwiseStatistics(df, columns_of_kind(catalog, "float"), filter_index, catalog)
+# Number of points scatter plots are reduced to by the "Downsample" option
+MAX_POINTS = 20000
+# Serialized figures of recently shown views, most requests repeat a small set of views
+figure_cache = LRUCache(max_entries=256, max_bytes=128 * 2**20, sizeof=lambda figures: sum(len(figure) for figure in figures))
+# Statistics of the clusters shown in the second graph, keyed by the clustered view
+summaries = LRUCache(max_entries=32, max_bytes=256 * 2**20, sizeof=lambda summary: summary.nbytes)
+# Clustering, trendlines and scatter matrices are built on their own threads, at most one view per session
+# The jobs are per process, background builds need a single worker or sticky sessions (see README.md)
+jobs = JobManager()
+# A callback waits this long for a background build before it answers with the progress instead
+JOB_WAIT_SECONDS = 0.2
 
 
 external_stylesheets = ['https://codepen.io/chriddyp/pen/bWLwgP.css']
-app = dash.Dash(__name__, external_stylesheets=external_stylesheets, title="ClinVis")
+# The responses are gzipped unless CLINVIS_COMPRESS is 0
+app = dash.Dash(__name__, external_stylesheets=external_stylesheets, title="ClinVis",
+                compress=os.environ.get("CLINVIS_COMPRESS", "1") != "0")
+# The WSGI server, e.g. for gunicorn app:server
+server = app.server
+if profiler is not None:
+    profiler.attach(server)
+startup.preload_heavy_modules()
+# Latency histograms of the callbacks registered below, served on /metrics
+metrics = Instrumentation()
+metrics.instrument(app, panel=panel_enabled())
 
 
-# This declares the app's layout
-app.layout = generate_layout(df, app)
+# This declares the app's layout, it is built for every page so each session gets its own id
+app.layout = lambda: generate_layout(df, app, metrics_panel=panel_enabled())
 
 
 # This callback is used to update the graph based on the chosen attribtes and graph types
+# The figure is stored in the browser, which highlights the selection on it without asking the server
+# In Explore mode linked_view names the clustered view whose groups the second graph summarizes
+# Expensive figures are built in the background, the job interval then polls this callback until they are ready
 @app.callback(
-    Output('main-graph', 'figure'),
-    Output('second-graph', 'figure'),
+    Output('main_figure', 'data'),
+    Output('linked_view', 'data'),
+    Output('job_status', 'children'),
+    Output('job_interval', 'disabled'),
     Input('dropdown_x', 'value'),
     Input('dropdown_y', 'value'),
     Input('dropdown_z', 'value'),
@@ -35,12 +84,13 @@ app.layout = generate_layout(df, app)
     Input('checklist_options', 'value'),
     Input("slider_filter", "value"),
     Input("dropdown_filter", "value"),
-    Input('main-graph', 'selectedData'),
     Input("flip_button", "n_clicks"),
     Input("cluster_dropdown", "value"),
-    Input("input_cluster", "value"))
-def update_figure(x, y, z, graph_type, options, value_filter_slider, value_filter_dropdown, selectedData, flip_value, cluster_value, n_clusters):
-    fig2 = generate_graph(df, x=[], y=[])
+    Input("input_cluster", "value"),
+    Input("job_interval", "n_intervals"),
+    State("session_state", "data"),
+    State("linked_view", "data"))
+def update_figure(x, y, z, graph_type, options, value_filter_slider, value_filter_dropdown, flip_value, cluster_value, n_clusters, n_intervals, session_state, linked_view):
     explore = False     # Indicates if "Explore" option is chosen
     # Create a dictionary with options and then unpack it in the generate_graph() call
     opts = dict()
@@ -51,30 +101,187 @@ def update_figure(x, y, z, graph_type, options, value_filter_slider, value_filte
             else:
                 explore = True
 
-    # Flip the axes if the "Flip" button is pressed
-    x_y = flip_axes(flip_value, opts, graph_type, x, y)
-
-    # Select points
-    select(df, selectedData, graph_type, x, y)
-
-    # Filter the data based on the filter values
-    data = filter_data(df, value_filter_dropdown, value_filter_slider)
+    # Skip the changes that can't change the figures, e.g. the slider when no filter column is chosen
+    if redundant_update(dash.callback_context.triggered, graph_type, explore, value_filter_dropdown):
+        raise PreventUpdate
+
+    with metrics.phase("data"):
+        # Flip the axes if the "Flip" button is pressed
+        x_y = flip_axes(flip_value, opts, graph_type, x, y)
+
+        # Filter the data based on the filter values, the correlation overview only needs the statistics of the rows
+        if graph_type == "correlation":
+            data = df
+            opts["matrix"] = pair_statistics.matrix(value_filter_dropdown, value_filter_slider)
+        else:
+            data = filter_data(df, value_filter_dropdown, value_filter_slider, filter_index)
+
+        # The selection is only needed here to keep the selected points when downsampling
+        downsampled = graph_type == "scatter" and "max_points" in opts
+        mask = get_selection(session_state, len(df)) if downsampled else None
+
+        # Reuse the figures if this view was built before
+        clustered = bool(cluster_value) and n_clusters != None and graph_type == "scatter" and explore == True
+        key = make_key(graph_type, x, y, z, sorted(options), flip_value % 2,
+                       value_filter_dropdown, value_filter_slider if value_filter_dropdown != None else None,
+                       selection_version(session_state) if downsampled else None,
+                       [cluster_value, n_clusters] if explore and graph_type == "scatter" else None)
+        figures = figure_cache.get(key)
+
+    linked = {"variables": cluster_value, "n_clusters": n_clusters,
+              "filter": [value_filter_dropdown, value_filter_slider if value_filter_dropdown != None else None]} \
+        if clustered else None
+    session = session_state.get("id") if session_state else None
+    if figures is None and session is not None and background_enabled() and \
+            expensive_view(graph_type, x, y, opts, clustered):
+        # The server thread is freed at once, a newer view of the session cancels this one
+        job = jobs.submit(session, key, lambda job: build_figures(data, x_y, z, graph_type, opts, mask, linked, key, job))
+        if not jobs.wait(job, JOB_WAIT_SECONDS):
+            progress = "{} ({:.0%})".format(job.message, job.progress)
+            return (dash.no_update, dash.no_update, progress, False)
+        try:
+            figures = job.future.result()
+        except (Cancelled, CancelledError):
+            # Cancelled while it ran or, by a newer view of the session, before it started
+            raise PreventUpdate
+        except Exception as error:
+            return (dash.no_update, dash.no_update, "The figure could not be built: {}".format(error), True)
+
+    elif figures is None:
+        jobs.release(session)
+        figures = build_figures(data, x_y, z, graph_type, opts, mask, linked, key)
+
+    else:
+        jobs.release(session)
+
+    with metrics.phase("serialization"):
+        # The second graph is only redrawn when the linked view changes
+        # The figure is sent as the JSON text orjson wrote, Dash only has to quote it and the browser parses it
+        linked = json.loads(figures[1])
+        return (figures[0].decode("utf-8"), linked if linked != linked_view else dash.no_update, "", True)
+
+
+def build_figures(data, x_y, z, graph_type, opts, mask, linked, key, job=None):
+    """ Builds, caches and returns the serialized figure and linked view, job reports the progress of a background build """
+    # The phases of the background builds are recorded apart from the callback that started them
+    callback = "update_figure_job" if job is not None else None
 
     # Cluster
-    if cluster_value != None and n_clusters != None and graph_type == "scatter" and explore == True:
-        data['Cluster'] = cluster(data, cluster_value, n_clusters)
-        data['Cluster'] = data['Cluster'].astype(str)
-        opts["color"] = data['Cluster']
-        fig2 = generate_graph(data, x=cluster_value, graph_type="box")
+    if linked:
+        report(job, 0.1, "Clustering")
+        # assign() returns a new frame, the filtered data may be the shared dataframe itself
+        # The labels are aligned on the row ids, rows with a missing value get none
+        # Several variables are scaled first since they have different units
+        with metrics.phase("clustering", callback):
+            model = cluster_model(data, linked["variables"], linked["n_clusters"], scale=len(linked["variables"]) > 1)
+            labels = model["labels"]
+            # The view keeps the start of the fit, its clusters are the same if they have to be computed again
+            linked = dict(linked, start=model.get("start"))
+            # The second graph is drawn from the statistics of the clusters
+            group_summary(linked, data, labels)
+            data = data.assign(Cluster=labels.astype(str))
+        opts = dict(opts, color='Cluster')
 
     # Generate graph
-    selected_points = list(data[data['select'] == True].index)
-    fig = generate_graph(data, x=x_y[0], y=x_y[1], z=z, graph_type=graph_type, selected_points=selected_points, **opts)
-
-    # Make the transition smoother and change the background to white
-    fig.update_layout(transition_duration=50, paper_bgcolor='rgba(0,0,0,0)', clickmode='event+select')
-
-    return (fig, fig2)
+    report(job, 0.4, "Building the figure")
+    with metrics.phase("figure", callback):
+        selected_points = np.flatnonzero(mask) if mask is not None else []
+        fig = generate_graph(data, x=x_y[0], y=x_y[1], z=z, graph_type=graph_type, selected_points=selected_points, **opts)
+
+        # Make the transition smoother and change the background to white
+        fig.update_layout(transition_duration=50, paper_bgcolor='rgba(0,0,0,0)', clickmode='event+select')
+
+    report(job, 0.8, "Sending the figure")
+    with metrics.phase("serialization", callback):
+        # The numeric arrays are sent as typed arrays, the browser decodes them in assets/callbacks.js
+        figures = (encode_figure(fig), json.dumps(linked))
+        figure_cache.put(key, figures)
+    return figures
+
+
+def group_summary(view, data=None, labels=None):
+    """ Returns the statistics of the clusters of a linked view, they are computed again if they were evicted """
+    key = make_key(view)
+    summary = summaries.get(key)
+    if summary is None:
+        if data is None:
+            data = filter_data(df, view["filter"][0], view["filter"][1], filter_index)
+            labels = cluster(data, view["variables"], view["n_clusters"], scale=len(view["variables"]) > 1,
+                             start=view.get("start"))
+        summary = GroupSummary(data, view["variables"], labels)
+        summaries.put(key, summary)
+    return summary
+
+
+def report(job, progress, message):
+    """ Reports the progress of a background build, it stops there if the build was cancelled """
+    if job is not None:
+        job.report(progress, message)
+
+
+def expensive_view(graph_type, x, y, opts, clustered):
+    """ Returns True for the views that are built in the background: clustering, trendlines and scatter matrices """
+    scatter_matrix = graph_type == "scatter" and (len(x) > 1 or len(y) > 1)
+    return clustered or scatter_matrix or (graph_type == "scatter" and "trendline" in opts)
+
+
+# The box plots of the clusters, with the selected rows next to all rows
+# A selection only updates the statistics with the rows that changed, the rows of the view are not read again
+@app.callback(
+    Output('second-graph', 'figure'),
+    Input('linked_view', 'data'),
+    Input('linked_selection', 'data'),
+    State('session_state', 'data'))
+def update_second_graph(view, selection, session_state):
+    if not view:
+        return generate_graph(df, x=[], y=[])
+
+    with metrics.phase("data"):
+        summary = group_summary(view)
+        selected = None
+        if session_state and session_state.get("rows") == len(df):
+            selected = summary.selected(session_state.get("id"), session_state["selection"])
+
+    with metrics.phase("figure"):
+        return generate_graph(df, x=view["variables"], graph_type="box_summary", summary=summary, selected=selected)
+
+
+def redundant_update(triggered, graph_type, explore, value_filter_dropdown):
+    """ Returns True if none of the inputs that triggered update_figure is used by the current view """
+    unused = set()
+    if value_filter_dropdown == None:
+        unused.add('slider_filter.value')
+    if graph_type not in ("heatmap", "ternary"):
+        unused.add('dropdown_z.value')
+    if not (explore and graph_type == "scatter"):
+        unused.update(['cluster_dropdown.value', 'input_cluster.value'])
+    return all(trigger['prop_id'] in unused for trigger in triggered)
+
+
+def use_dataset(frame):
+    """ Replaces the shared dataset, e.g. with synthetic data in the benchmarks
+
+    Everything derived from the rows is rebuilt or dropped, the layout of pages already served is left as it is.
+    """
+    global df, catalog, float_options, strip_options, filter_index, pair_statistics
+    df = frame
+    catalog = build_catalog(df)
+    float_options = options(columns_of_kind(catalog, "float"))
+    strip_options = options(columns_of_kind(catalog, "int") + columns_of_kind(catalog, "object"))
+    filter_index = FilterIndex(df, catalog)
+    pair_statistics = PairwiseStatistics(df, columns_of_kind(catalog, "float"), filter_index, catalog)
+    # The fits are keyed by row ids, which a new dataset reuses
+    figure_cache.clear()
+    summaries.clear()
+    exploration.models.clear()
+    exploration.last_centers.clear()
+    regression.fits.clear()
+
+
+@server.route('/figure-cache')
+def figure_cache_stats():
+    """ Reports the hit and miss counters of the figure cache """
+    return flask.jsonify(figure_cache.stats())
 
 
 # This callback is used to change the options avaliable in the dropdowns
@@ -92,11 +299,11 @@ def dynamic_options(graph_type, value_x, value_y):
     if graph_type == "histogram":
         # Only numerical values for the X are possible
         if len(value_x) > 1:
-            return ([{'label': value, 'value': value} for value in df.columns[df.dtypes=="float"]],
+            return (float_options,
                     [],
                     [],
                     [])
-        return ([{'label': value, 'value': value} for value in df.columns[df.dtypes=="float"]],
+        return (float_options,
                 [],
                 [],
                 [{'label': 'SARS-Cov-2 test result', 'value': '{"color": "SARS-Cov-2 exam result"}'}])
@@ -104,46 +311,57 @@ def dynamic_options(graph_type, value_x, value_y):
     elif graph_type == "scatter":
         # Only numerical values for both X and Y axes are possible
         if len(value_x) == 1 and len(value_y) == 1:
-            return ([{'label': value, 'value': value} for value in df.columns[df.dtypes=="float"]], 
-                    [{'label': value, 'value': value} for value in df.columns[df.dtypes=="float"]],
+            return (float_options, 
+                    float_options,
                     [],
                     [{'label': 'SARS-Cov-2 test result', 'value': '{"color": "SARS-Cov-2 exam result"}'},
                     {'label': 'Explore Mode', 'value': '{"explore": True}'},
-                    {'label': 'Trendline', 'value': '{"trendline": "ols"}'}
+                    {'label': 'Trendline', 'value': '{"trendline": "ols"}'},
+                    {'label': 'LOWESS', 'value': '{"trendline": "lowess"}'},
+                    {'label': 'Downsample', 'value': '{"max_points": ' + str(MAX_POINTS) + '}'}
                      ])
 
-        return ([{'label': value, 'value': value} for value in df.columns[df.dtypes=="float"]],
-                    [{'label': value, 'value': value} for value in df.columns[df.dtypes=="float"]],
+        return (float_options,
+                    float_options,
                     [],
-                    [{'label': 'SARS-Cov-2 test result', 'value': '{"color": "SARS-Cov-2 exam result"}'}])
+                    [{'label': 'SARS-Cov-2 test result', 'value': '{"color": "SARS-Cov-2 exam result"}'},
+                    {'label': 'Downsample', 'value': '{"max_points": ' + str(MAX_POINTS) + '}'}])
 
     elif graph_type == "heatmap":
-        # Only numerical values for both X and Y axes are possible
-        return ([{'label': value, 'value': value} for value in df.columns[df.dtypes=="float"]],
-        [{'label': value, 'value': value} for value in df.columns[df.dtypes=="float"]],
-        [],
-        [])
+        # Only numerical values for both X and Y axes are possible, Z is aggregated in every cell
+        return (float_options,
+        float_options,
+        float_options,
+        [{'label': 'Mean of Z', 'value': '{"histfunc": "mean"}'},
+        {'label': 'Median of Z', 'value': '{"histfunc": "median"}'}])
 
     elif graph_type == "par_coords":
         # Only numerical values for X axis are possible
-        return ([{'label': value, 'value': value} for value in df.columns[df.dtypes=="float"]],
-        [{'label': value, 'value': value} for value in df.columns[df.dtypes=="float"]],
+        return (float_options,
+        float_options,
         [],
         [{'label': 'SARS-Cov-2 test result', 'value': '{"color": "COVID-19"}'}])
 
     elif graph_type == "strip":
         # Both numerical and categorical values X and Y respectively axes are possible
-        return ([{'label': value, 'value': value} for value in df.columns[df.dtypes=="int64"].to_list()+df.columns[df.dtypes=="object"][1:].to_list()],
-        [{'label': value, 'value': value} for value in df.columns[df.dtypes=="float"]],
+        return (strip_options,
+        float_options,
         [],
         [{'label': 'SARS-Cov-2 test result', 'value': '{"color": "SARS-Cov-2 exam result"}'}])
 
     elif graph_type == "ternary":
-        return ([{'label': value, 'value': value} for value in df.columns[df.dtypes=="float"]],
-        [{'label': value, 'value': value} for value in df.columns[df.dtypes=="float"]],
-        [{'label': value, 'value': value} for value in df.columns[df.dtypes=="float"]], 
+        return (float_options,
+        float_options,
+        float_options, 
         [{'label': 'SARS-Cov-2 test result', 'value': '{"color": "SARS-Cov-2 exam result"}'}])
 
+    elif graph_type == "correlation":
+        # The variables to compare, all float columns when none is chosen
+        return (float_options,
+        [],
+        [],
+        [])
+
 
 @app.callback(Output("slider_filter", "min"),
               Output("slider_filter", "max"),
@@ -155,9 +373,10 @@ def adjust_filter_slider(value):
     """ Adjust the ranges of the filtering slider based on the variable type """
 
     if value != None:
-        if df[value].dtypes == "float64":
-            maximum = df.max()[value]
-            minimum = df.min()[value]
+        entry = catalog[value]
+        if entry["kind"] == "float":
+            maximum = entry["max"]
+            minimum = entry["min"]
             middle = minimum + (maximum - minimum)/2
             return (minimum,
                     maximum,
@@ -165,124 +384,104 @@ def adjust_filter_slider(value):
                     [minimum, maximum],
                     0.1)
 
-        elif df[value].dtypes == "int64":
-            maximum = int(df.max()[value])
-            minimum = int(df.min()[value])
+        elif entry["kind"] == "int":
+            maximum = int(entry["max"])
+            minimum = int(entry["min"])
             return (minimum,
                     maximum,
                     {minimum: "{}".format(minimum), maximum: "{}".format(maximum)},
                     [minimum, maximum],
                     1)
 
-        elif df[value].dtypes == "object":
-            length = len(df[value].dropna().unique()) - 1
-            marks_dictionary = dict()
-            for i in range(length+1):
-                marks_dictionary[i] = df[value].dropna().unique()[i]
+        elif entry["kind"] == "object" and entry["categories"]:
+            # The slider values are the category codes, the marks show their labels
+            length = len(entry["categories"]) - 1
+            marks_dictionary = dict(enumerate(entry["categories"]))
             return [0, length, marks_dictionary, [0, length], 1]
 
     return (0, 20, {0: "", 20: ""}, [0, 20], 0.1)
 
 
-@app.callback(Output("main-graph", "selectedData"),
-            Input("flip_button", "n_clicks"),
-            Input('checklist_options', 'value'),
-            Input("dropdown_filter", "value"),
-            Input("slider_filter", "value"))
-def clear_data(n_clicks, option, filter, range):
-    """ Clear the selected data on state change """
-    return None
-
-
-@app.callback(Output("cluster_dropdown", "options"),
-            Input('dropdown_x', 'value'),
-            Input('dropdown_y', 'value'))
-def clustring_options(x_value, y_value):
-    """ Generate clustering options """
+# Callbacks that only change the page run in the browser, see assets/callbacks.js
+# Selecting points toggles them in the session state and highlights them on the stored figure, without a request
+app.clientside_callback(
+    ClientsideFunction(namespace="clinvis", function_name="update_session"),
+    Output("session_state", "data"),
+    Input('main-graph', 'selectedData'),
+    State("session_state", "data"),
+    State('radio_graph_type', 'value'),
+    State('main_figure', 'data'))
 
-    values = x_value + y_value
-    return ([{'label': value, 'value': value} for value in values])
 
+app.clientside_callback(
+    ClientsideFunction(namespace="clinvis", function_name="highlight_selection"),
+    Output("main-graph", "figure"),
+    Input('main_figure', 'data'),
+    Input("session_state", "data"))
 
-@app.callback(Output("second-graph", "style"),
-            Input('cluster_dropdown', 'value'),
-            Input('input_cluster', 'value'),
-            Input('checklist_options', 'value'))
-def show_second_graph(variable, n_clusters, options):
-    """ Shows second graph """
 
-    if any("explore" in option for option in options):
-        if variable != None and n_clusters != None and n_clusters > 1:
-            return {"display": "block"}
+# The second graph only follows the selection in Explore mode
+app.clientside_callback(
+    ClientsideFunction(namespace="clinvis", function_name="link_selection"),
+    Output("linked_selection", "data"),
+    Input("session_state", "data"),
+    State("linked_view", "data"),
+    State("linked_selection", "data"))
 
 
-@app.callback(Output("cluster_dropdown", "style"),
-            Output("input_cluster_container", "style"),
-            Output("cluster_label", "style"),
-            Input('checklist_options', 'value'),
-            Input('radio_graph_type', 'value'))
-def show_clustering_controls(options, graph_type):
-    """ Shows a dropdown and a input field for clustering """
+app.clientside_callback(
+    ClientsideFunction(namespace="clinvis", function_name="clear_data"),
+    Output("main-graph", "selectedData"),
+    Input("flip_button", "n_clicks"),
+    Input('checklist_options', 'value'),
+    Input("dropdown_filter", "value"),
+    Input("slider_filter", "value"))
 
-    if any("explore" in option for option in options) and graph_type == "scatter":
-        return ({"display": "block"}, {"display": "block"}, {"display": "block"})
-    return ({"display": "none"}, {"display": "none"}, {"display": "none"})
 
+app.clientside_callback(
+    ClientsideFunction(namespace="clinvis", function_name="clustering_options"),
+    Output("cluster_dropdown", "options"),
+    Input('dropdown_x', 'value'),
+    Input('dropdown_y', 'value'))
 
-@app.callback(Output("dropdown_x_container", "style"),
-                Output("dropdown_y_container", "style"),
-                Output("dropdown_z_container", "style"),
-                Output("x_axis_label", "children"),
-                Output("y_axis_label", "children"),
-                Output("z_axis_label", "children"),
-                Output("flip_button_container", "style"),
-                Input('radio_graph_type', 'value'))
-def adjust_dropdowns(graph_type):
-    """ Dynamically adjust the input dropdowns based on the graph type """
 
-    if graph_type == "histogram":
-        return ({"width": "46%", "display": "inline-block"},
-                {"display": "none"}, {"display": "none"},
-                "Choose variable(s)",
-                "",
-                "",
-                None)
+app.clientside_callback(
+    ClientsideFunction(namespace="clinvis", function_name="show_second_graph"),
+    Output("second-graph", "style"),
+    Input('cluster_dropdown', 'value'),
+    Input('input_cluster', 'value'),
+    Input('checklist_options', 'value'))
 
-    elif graph_type == "par_coords":
-        return ({"width": "46%", "display": "inline-block"},
-                {"display": "none"}, {"display": "none"},
-                "Choose variable(s)",
-                "",
-                "",
-                {"display": "none"})
-
-    elif graph_type in ["scatter", "heatmap", "strip"]:
-        return ({"width": "46%", "display": "inline-block"},
-                {"width": "46%", "display": "inline-block"},
-                {"display": "none"},
-                "Select X Axis",
-                "Select Y Axis",
-                "",
-                None)
 
-    elif graph_type == "ternary":
-        return ({"width": "30%", "display": "inline-block", 'float': 'none', 'margin-right': '5%'},
-                {"width": "30%", "display": "inline-block", 'float': 'none', 'margin-right': '5%'},
-                {"width": "30%", "display": "inline-block", 'float': 'none'},
-                "Select X Axis",
-                "Select Y Axis",
-                "Select Z Axis",
-                {"display": "none"})
-
-    return (None, None, None, "", "", "", None)
-
-
-@app.callback(Output('checklist_options', 'value'),
-                Output("flip_button", "n_clicks"),
-                Input('radio_graph_type', 'value'))
-def clear_options(graph_type):
-    """ Clear the options and reset the flip button on state change """
-    return ([], 0)
+app.clientside_callback(
+    ClientsideFunction(namespace="clinvis", function_name="show_clustering_controls"),
+    Output("cluster_dropdown", "style"),
+    Output("input_cluster_container", "style"),
+    Output("cluster_label", "style"),
+    Input('checklist_options', 'value'),
+    Input('radio_graph_type', 'value'))
+
+
+app.clientside_callback(
+    ClientsideFunction(namespace="clinvis", function_name="adjust_dropdowns"),
+    Output("dropdown_x_container", "style"),
+    Output("dropdown_y_container", "style"),
+    Output("dropdown_z_container", "style"),
+    Output("x_axis_label", "children"),
+    Output("y_axis_label", "children"),
+    Output("z_axis_label", "children"),
+    Output("flip_button_container", "style"),
+    Input('radio_graph_type', 'value'))
+
+
+# Resetting in the browser lets update_figure run once with the new graph type and the reset options
+app.clientside_callback(
+    ClientsideFunction(namespace="clinvis", function_name="clear_options"),
+    Output('checklist_options', 'value'),
+    Output("flip_button", "n_clicks"),
+    Input('radio_graph_type', 'value'),
+    State('checklist_options', 'value'),
+    State("flip_button", "n_clicks"))
 
 
 if __name__ == '__main__':
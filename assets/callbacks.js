@@ -0,0 +1,211 @@
+/* Callbacks that only change the page, they run in the browser without a request to the server */
+
+(function() {
+    function is_explore(options) {
+        return (options || []).some(function(option) {
+            return option.indexOf("explore") !== -1;
+        });
+    }
+
+    function base64_bytes(encoded) {
+        var text = atob(encoded);
+        var bytes = new Uint8Array(text.length);
+        for (var i = 0; i < text.length; i++) {
+            bytes[i] = text.charCodeAt(i);
+        }
+        return bytes;
+    }
+
+    /* The selection is a bitset of row ids encoded like graph_generation/session.py does with numpy.packbits */
+    function decode_mask(encoded) {
+        return base64_bytes(encoded);
+    }
+
+    /* Numeric arrays of the figures come as base64 typed arrays, see graph_generation/serialization.py */
+    var TYPED_ARRAYS = {f4: Float32Array, f8: Float64Array, i4: Int32Array, u4: Uint32Array, u1: Uint8Array};
+
+    function decode_arrays(value) {
+        if (Array.isArray(value)) {
+            return value.map(decode_arrays);
+        }
+        if (!value || typeof value !== "object" || ArrayBuffer.isView(value)) {
+            return value;
+        }
+        if (typeof value.bdata === "string" && TYPED_ARRAYS[value.dtype]) {
+            var array = new TYPED_ARRAYS[value.dtype](base64_bytes(value.bdata).buffer);
+            var shape = value.shape ? String(value.shape).split(",").map(Number) : [array.length];
+            if (shape.length < 2) {
+                return array;
+            }
+            // Plotly reads a matrix as a list of rows
+            var rows = [];
+            for (var row = 0; row < shape[0]; row++) {
+                rows.push(array.subarray(row * shape[1], (row + 1) * shape[1]));
+            }
+            return rows;
+        }
+        var decoded = {};
+        Object.keys(value).forEach(function(key) {
+            decoded[key] = decode_arrays(value[key]);
+        });
+        return decoded;
+    }
+
+    /* The stored figure is the JSON text written by the server, it is parsed and its typed arrays decoded once */
+    var decoded_figure = {text: null, figure: null};
+
+    function decode_figure(text) {
+        if (!text) {
+            return text;
+        }
+        if (decoded_figure.text !== text) {
+            var figure = JSON.parse(text);
+            figure = Object.assign({}, figure, {data: figure.data.map(decode_arrays)});
+            decoded_figure = {text: text, figure: figure};
+        }
+        return decoded_figure.figure;
+    }
+
+    function encode_mask(bits) {
+        var text = "";
+        // In parts, the arguments of a function call are limited
+        for (var i = 0; i < bits.length; i += 8192) {
+            text += String.fromCharCode.apply(null, bits.subarray(i, i + 8192));
+        }
+        return btoa(text);
+    }
+
+    function is_selected(bits, row) {
+        return (bits[row >> 3] >> (7 - (row & 7))) & 1;
+    }
+
+    /* The row ids of the selected points, traces built from the data carry them as customdata */
+    function selected_rows(points, figure) {
+        var rows = new Set();
+        points.forEach(function(point) {
+            var customdata = point.customdata;
+            if (customdata === undefined && figure && figure.data[point.curveNumber].customdata) {
+                customdata = figure.data[point.curveNumber].customdata[point.pointIndex];
+            }
+            if (customdata !== undefined) {
+                rows.add(customdata[0]);
+            }
+        });
+        return rows;
+    }
+
+    window.dash_clientside = Object.assign({}, window.dash_clientside, {
+        clinvis: {
+            /* Toggle the selected points in the session state */
+            update_session: function(selectedData, state, graph_type, figure) {
+                // A cleared selection changes nothing, the figure isn't highlighted again
+                if (!state || graph_type !== "scatter" || !selectedData || !selectedData.points
+                        || !selectedData.points.length) {
+                    return window.dash_clientside.no_update;
+                }
+                var bits = decode_mask(state.selection);
+                selected_rows(selectedData.points, decode_figure(figure)).forEach(function(row) {
+                    if (row < state.rows) {
+                        bits[row >> 3] ^= 1 << (7 - (row & 7));
+                    }
+                });
+                return Object.assign({}, state, {selection: encode_mask(bits)});
+            },
+
+            /* Show the stored figure with the selected points highlighted in yellow */
+            highlight_selection: function(figure, state) {
+                if (!figure) {
+                    return window.dash_clientside.no_update;
+                }
+                figure = decode_figure(figure);
+                var bits = state ? decode_mask(state.selection) : new Uint8Array(0);
+                var any = bits.some(function(byte) { return byte !== 0; });
+
+                // Only the traces of the points change, the rest of the figure is shared with the stored one
+                var data = figure.data.map(function(trace) {
+                    if (!trace.customdata || (trace.type !== "scatter" && trace.type !== "scattergl")) {
+                        return trace;
+                    }
+                    trace = Object.assign({}, trace);
+                    delete trace.selectedpoints;
+                    if (any) {
+                        trace.selectedpoints = [];
+                        for (var i = 0; i < trace.customdata.length; i++) {
+                            if (is_selected(bits, trace.customdata[i][0])) {
+                                trace.selectedpoints.push(i);
+                            }
+                        }
+                        trace.selected = {marker: {color: "yellow"}};
+                    }
+                    return trace;
+                });
+                return Object.assign({}, figure, {data: data});
+            },
+
+            /* Pass the selection on to the second graph while it shows a clustered view */
+            link_selection: function(state, view, previous) {
+                if (!view || !state || state.selection === previous) {
+                    return window.dash_clientside.no_update;
+                }
+                return state.selection;
+            },
+
+            /* Clear the selected data on state change */
+            clear_data: function(n_clicks, option, filter, range) {
+                return null;
+            },
+
+            /* Clear the options and reset the flip button when the graph type changes */
+            clear_options: function(graph_type, options, n_clicks) {
+                // Unchanged values are not sent, they would fire the callbacks that use them again
+                var no_update = window.dash_clientside.no_update;
+                return [options && options.length ? [] : no_update,
+                        n_clicks ? 0 : no_update];
+            },
+
+            /* Generate clustering options */
+            clustering_options: function(x_value, y_value) {
+                return (x_value || []).concat(y_value || []).map(function(value) {
+                    return {label: value, value: value};
+                });
+            },
+
+            /* Shows second graph */
+            show_second_graph: function(variable, n_clusters, options) {
+                if (is_explore(options) && variable && variable.length && n_clusters != null && n_clusters > 1) {
+                    return {display: "block"};
+                }
+                return null;
+            },
+
+            /* Shows a dropdown and a input field for clustering */
+            show_clustering_controls: function(options, graph_type) {
+                var style = {display: is_explore(options) && graph_type === "scatter" ? "block" : "none"};
+                return [style, style, style];
+            },
+
+            /* Dynamically adjust the input dropdowns based on the graph type */
+            adjust_dropdowns: function(graph_type) {
+                var half = {width: "46%", display: "inline-block"};
+                var hidden = {display: "none"};
+                var third = {width: "30%", display: "inline-block", float: "none", "margin-right": "5%"};
+                var last_third = {width: "30%", display: "inline-block", float: "none"};
+
+                if (graph_type === "histogram") {
+                    return [half, hidden, hidden, "Choose variable(s)", "", "", null];
+                } else if (graph_type === "correlation") {
+                    return [half, hidden, hidden, "Choose variables (all if empty)", "", "", hidden];
+                } else if (graph_type === "par_coords") {
+                    return [half, hidden, hidden, "Choose variable(s)", "", "", hidden];
+                } else if (graph_type === "scatter" || graph_type === "strip") {
+                    return [half, half, hidden, "Select X Axis", "Select Y Axis", "", null];
+                } else if (graph_type === "heatmap") {
+                    return [third, third, last_third, "Select X Axis", "Select Y Axis", "Select Z (mean/median)", null];
+                } else if (graph_type === "ternary") {
+                    return [third, third, last_third, "Select X Axis", "Select Y Axis", "Select Z Axis", hidden];
+                }
+                return [null, null, null, "", "", "", null];
+            }
+        }
+    });
+})();
@@ -0,0 +1,101 @@
+""" Counts the requests the browser sends to the server for every user action
+
+The callbacks an action fires are followed through the callback graph of the app, like the Dash renderer does:
+a callback runs once all the callbacks that can change its inputs are done, and is assumed to change all its outputs.
+Run it from the repository root with python -m benchmarks.round_trips, the results are written as JSON with --output.
+"""
+import argparse
+import json
+
+import app
+
+
+# The inputs a user changes in each action
+ACTIONS = [
+    ("graph type", ["radio_graph_type.value"]),
+    ("x axis", ["dropdown_x.value"]),
+    ("z axis", ["dropdown_z.value"]),
+    ("option", ["checklist_options.value"]),
+    ("flip", ["flip_button.n_clicks"]),
+    ("filter column", ["dropdown_filter.value"]),
+    ("filter range", ["slider_filter.value"]),
+    ("selection", ["main-graph.selectedData"]),
+    ("cluster variable", ["cluster_dropdown.value"]),
+    ("cluster count", ["input_cluster.value"]),
+    ("background poll", ["job_interval.n_intervals"]),
+]
+
+
+def parse_outputs(output):
+    """ Returns the "id.property" strings of the output of a registered callback """
+    if output.startswith(".."):
+        return output[2:-2].split("...")
+    return [output]
+
+
+def callback_graph(dash_app):
+    """ Returns the name, inputs, outputs and the side (server or client) of every registered callback """
+    callbacks = []
+    for entry in dash_app._callback_list:
+        clientside = entry.get("clientside_function")
+        if clientside:
+            name = clientside["function_name"]
+        else:
+            name = dash_app.callback_map[entry["output"]]["callback"].__name__
+        callbacks.append({"name": name,
+                          "server": not clientside,
+                          "inputs": {"{}.{}".format(i["id"], i["property"]) for i in entry["inputs"]},
+                          "outputs": set(parse_outputs(entry["output"]))})
+    return callbacks
+
+
+def follow(callbacks, changed):
+    """ Returns the fired callbacks and the number of server requests on the longest chain of the action """
+    fired = dict()
+    pending = set(changed)
+    while pending:
+        new = set()
+        for callback in callbacks:
+            if callback["name"] not in fired and callback["inputs"] & pending:
+                fired[callback["name"]] = callback
+                new |= callback["outputs"]
+        pending = new
+
+    # Each callback waits for the fired callbacks that write its inputs
+    depth = dict()
+
+    def chain(callback):
+        if callback["name"] not in depth:
+            depth[callback["name"]] = 0
+            upstream = [other for other in fired.values() if other["outputs"] & callback["inputs"]
+                        and other is not callback]
+            depth[callback["name"]] = int(callback["server"]) + max([chain(other) for other in upstream] or [0])
+        return depth[callback["name"]]
+
+    sequential = max([chain(callback) for callback in fired.values()] or [0])
+    return list(fired.values()), sequential
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--output", help="result file")
+    args = parser.parse_args(argv)
+
+    callbacks = callback_graph(app.app)
+    results = []
+    print("{:<18} {:>8} {:>11} {:>8}  server callbacks".format("action", "requests", "sequential", "browser"))
+    for action, changed in ACTIONS:
+        fired, sequential = follow(callbacks, changed)
+        server = [callback["name"] for callback in fired if callback["server"]]
+        results.append({"action": action, "requests": len(server), "sequential": sequential,
+                        "clientside": len(fired) - len(server), "callbacks": server})
+        print("{:<18} {:>8} {:>11} {:>8}  {}".format(action, len(server), sequential, len(fired) - len(server),
+                                                    ", ".join(server)))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+""" Times the graph generation, the interaction helpers and the update_figure callback on synthetic data
+
+Run it from the repository root with python -m benchmarks.run, the results are written as JSON to benchmarks/results/.
+"""
+import argparse
+import contextlib
+import datetime
+import gzip
+import itertools
+import json
+import os
+import platform
+import subprocess
+import time
+import flask
+import numpy as np
+import pandas as pd
+import plotly
+import dash
+from plotly.utils import PlotlyJSONEncoder
+
+import app
+from benchmarks.synthetic import synthetic_frame
+from data_processing.catalog import columns_of_kind
+from data_processing.encoding import encode_categories
+from data_processing.store import DUMMY_COLUMN, RESULT_COLUMN, ROW_FILTER_COLUMN
+from graph_generation import exploration, regression
+from graph_generation.graph_generation import generate_graph
+from graph_generation.interaction import FilterIndex, filter_data
+from graph_generation.session import new_state, encode_mask
+from graph_generation.statistics import PairwiseStatistics
+from graph_generation.linked import GroupSummary
+from graph_generation.serialization import encode_figure, fast_dumps, figure_json
+
+
+SIZES = (5000, 100000, 1000000)
+RESULTS_DIR = os.path.join("benchmarks", "results")
+
+# Columns of dataset.xlsx used by the cases
+X = ROW_FILTER_COLUMN
+Y = "Platelets"
+Z = "Leukocytes"
+FLOAT_FILTER = "Hemoglobin"
+STRIP_X = "Patient age quantile"
+
+# generate_graph arguments of every graph type and its main options
+GRAPH_CASES = [
+    ("histogram", dict(x=[X], y=[], graph_type="histogram")),
+    ("histogram_wide", dict(x=[X, Y, Z], y=[], graph_type="histogram")),
+    ("histogram_color", dict(x=[X], y=[], graph_type="histogram", color=RESULT_COLUMN)),
+    ("scatter", dict(x=[X], y=[Y], graph_type="scatter")),
+    ("scatter_color", dict(x=[X], y=[Y], graph_type="scatter", color=RESULT_COLUMN)),
+    ("scatter_ols", dict(x=[X], y=[Y], graph_type="scatter", color=RESULT_COLUMN, trendline="ols")),
+    ("scatter_lowess", dict(x=[X], y=[Y], graph_type="scatter", trendline="lowess")),
+    ("scatter_downsampled", dict(x=[X], y=[Y], graph_type="scatter", max_points=app.MAX_POINTS)),
+    ("scatter_matrix", dict(x=[X, Y], y=[Z], graph_type="scatter")),
+    ("heatmap", dict(x=[X], y=[Y], z=[], graph_type="heatmap")),
+    ("heatmap_mean", dict(x=[X], y=[Y], z=[Z], graph_type="heatmap", histfunc="mean")),
+    ("par_coords", dict(x=[X, Y, Z], y=[], graph_type="par_coords", color=DUMMY_COLUMN)),
+    ("strip", dict(x=[STRIP_X], y=[Y], graph_type="strip", color=RESULT_COLUMN)),
+    # Text categories are object arrays in the figure, which orjson can't encode as they are
+    ("strip_category", dict(x=[RESULT_COLUMN], y=[Y], graph_type="strip")),
+    ("ternary", dict(x=[X], y=[Y], z=[Z], graph_type="ternary")),
+]
+
+# The inputs of update_figure in the order of its arguments, with the values of a fresh page
+CALLBACK_DEFAULTS = dict(x=[X], y=[Y], z=[], graph_type="scatter", options=[], value_filter_slider=[0, 20],
+                         value_filter_dropdown=None, flip_value=0, cluster_value=None, n_clusters=None,
+                         n_intervals=None, session_state=None, linked_view=None)
+
+# update_figure inputs of every graph type and of the interactions, with the input that triggers the call
+CALLBACK_CASES = [
+    ("histogram", "graph_type.value", dict(x=[X], y=[], graph_type="histogram")),
+    ("scatter", "graph_type.value", dict()),
+    ("scatter_downsampled", "checklist_options.value",
+     dict(options=['{"max_points": ' + str(app.MAX_POINTS) + '}'])),
+    ("scatter_filtered", "slider_filter.value", dict(value_filter_dropdown=RESULT_COLUMN, value_filter_slider=[1, 1])),
+    # Selections are handled in the browser, the server only keeps the selected points when downsampling
+    ("scatter_selected_downsampled", "checklist_options.value",
+     dict(options=['{"max_points": ' + str(app.MAX_POINTS) + '}'], session_state="selected")),
+    ("scatter_explore", "input_cluster.value",
+     dict(options=['{"explore": True}'], cluster_value=[X], n_clusters=3)),
+    ("heatmap", "graph_type.value", dict(z=[Z], graph_type="heatmap", options=['{"histfunc": "mean"}'])),
+    ("par_coords", "graph_type.value", dict(x=[X, Y, Z], y=[], graph_type="par_coords",
+                                            options=['{"color": "' + DUMMY_COLUMN + '"}'])),
+    ("strip", "graph_type.value", dict(x=[STRIP_X], graph_type="strip")),
+    ("ternary", "graph_type.value", dict(z=[Z], graph_type="ternary")),
+    ("correlation", "graph_type.value", dict(x=[], y=[], graph_type="correlation")),
+    ("correlation_filtered", "slider_filter.value", dict(x=[], y=[], graph_type="correlation",
+                                                         value_filter_dropdown=RESULT_COLUMN, value_filter_slider=[1, 1])),
+]
+
+
+def measure(function, repeat, setup=None):
+    """ Calls function repeat times and returns the timings in seconds and the last result """
+    times = []
+    result = None
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    return {"repeat": repeat, "min": min(times), "median": float(np.median(times)), "mean": float(np.mean(times))}, result
+
+
+def clear_caches():
+    """ Drops the cached figures and fits so every call does the full work """
+    app.figure_cache.clear()
+    exploration.models.clear()
+    exploration.last_centers.clear()
+    regression.fits.clear()
+
+
+@contextlib.contextmanager
+def triggered_by(prop_id):
+    """ Lets a callback run outside of a request as if the input prop_id had changed """
+    triggered = [{"prop_id": prop_id, "value": None}]
+    with app.server.test_request_context():
+        # Dash 1 reads the triggered inputs from the request globals, Dash 2 from a context variable
+        flask.g.triggered_inputs = triggered
+        try:
+            from dash._callback_context import context_value
+            from dash._utils import AttributeDict
+        except ImportError:
+            yield
+            return
+        token = context_value.set(AttributeDict(triggered_inputs=triggered, inputs_list=[], states_list=[],
+                                                outputs_list=[]))
+        try:
+            yield
+        finally:
+            context_value.reset(token)
+
+
+def selection(df, share=0.01, max_points=5000, seed=0):
+    """ Returns a box selection of random rows as plotly sends it """
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(len(df), min(max(int(len(df) * share), 1), max_points), replace=False)
+    return {"points": [{"pointIndex": int(row), "customdata": [int(row)]} for row in rows]}
+
+
+def selected_state(df):
+    """ Returns a session state in which the rows of selection() are selected """
+    mask = np.zeros(len(df), dtype=bool)
+    mask[[point["customdata"][0] for point in selection(df)["points"]]] = True
+    return dict(new_state(len(df)), selection=encode_mask(mask))
+
+
+def bench_graphs(df, repeat):
+    results = []
+    for name, arguments in GRAPH_CASES:
+        timing, fig = measure(lambda: generate_graph(df, **arguments), repeat, clear_caches)
+        serialization, figure_json = measure(fig.to_json, repeat)
+        results.append(dict(group="generate_graph", case=name, serialization=serialization["median"],
+                            bytes=len(figure_json), **timing))
+    return results
+
+
+def bench_serialization(df, repeat):
+    """ Compares the JSON encoding of the figures by Dash with the typed arrays of graph_generation/serialization.py """
+    variants = [
+        # Dash encodes the figures it is given like this, a cached figure is decoded and encoded again
+        ("plotly", lambda fig: json.dumps(fig, cls=PlotlyJSONEncoder).encode("utf-8"),
+         lambda encoded: json.dumps(json.loads(encoded), cls=PlotlyJSONEncoder)),
+        # update_figure returns the encoded text, Dash only quotes it
+        ("typed", encode_figure, lambda encoded: json.dumps(encoded.decode("utf-8"), cls=PlotlyJSONEncoder)),
+    ]
+    results = []
+    for name, arguments in GRAPH_CASES:
+        fig = generate_graph(df, **arguments)
+        # The typed figures should be written by orjson, the json module is the slow fallback for values it can't encode
+        writer = "orjson" if fast_dumps(figure_json(fig, typed_arrays=True)) is not None else "json"
+        if writer != "orjson":
+            print("{} (typed) was written by the json module".format(name), flush=True)
+        for variant, encode, respond in variants:
+            timing, encoded = measure(lambda: encode(fig), repeat)
+            response, sent = measure(lambda: respond(encoded).encode("utf-8"), repeat)
+            results.append(dict(group="serialization", case="{} ({})".format(name, variant), response=response["median"],
+                                writer="json" if variant == "plotly" else writer, bytes=len(sent),
+                                gzip_bytes=len(gzip.compress(sent, 6)), **timing))
+    return results
+
+
+def bench_interaction(df, repeat):
+    index = FilterIndex(df, app.catalog)
+    low, high = app.catalog[FLOAT_FILTER]["quantiles"][1], app.catalog[FLOAT_FILTER]["quantiles"][3]
+    floats = columns_of_kind(app.catalog, "float")
+    labels = exploration.cluster(df, [X], 3)
+    summary = GroupSummary(df, [X, Y], labels)
+    # Every call changes the selection by the rows of selection(), like a new box selection does
+    selections = itertools.cycle([selected_state(df)["selection"], new_state(len(df))["selection"]])
+
+    cases = [
+        # A new index is built on the first filter of a column
+        ("filter_float_cold", lambda: filter_data(df, FLOAT_FILTER, [low, high], FilterIndex(df, app.catalog))),
+        ("filter_float", lambda: filter_data(df, FLOAT_FILTER, [low, high], index)),
+        ("filter_category", lambda: filter_data(df, RESULT_COLUMN, [1, 1], index)),
+        ("cluster_1d", lambda: exploration.cluster(df, [X], 3)),
+        ("cluster_kmeans", lambda: exploration.cluster(df, [X, Y], 3, scale=True)),
+        # The correlations of all rows are computed at load, the bucket sums on the first filter of a column
+        ("correlation_load", lambda: PairwiseStatistics(df, floats, index, app.catalog)),
+        ("correlation_filter", lambda: app.pair_statistics.matrix(FLOAT_FILTER, [low, high])),
+        ("linked_summary", lambda: GroupSummary(df, [X, Y], labels)),
+        ("linked_selection", lambda: summary.box_statistics(summary.selected("benchmark", next(selections)))),
+    ]
+    results = []
+    for name, function in cases:
+        timing, _ = measure(function, repeat, clear_caches)
+        results.append(dict(group="interaction", case=name, **timing))
+    return results
+
+
+def bench_callback(df, repeat):
+    update_figure = getattr(app.update_figure, "__wrapped__", app.update_figure)
+    results = []
+    # Without a session id the figures are built in the callback, like CLINVIS_BACKGROUND=0 does
+    for name, trigger, overrides in CALLBACK_CASES:
+        inputs = dict(CALLBACK_DEFAULTS, **overrides)
+        if inputs["session_state"] == "selected":
+            inputs["session_state"] = selected_state(df)
+
+        with triggered_by(trigger):
+            call = lambda: update_figure(*inputs.values())
+            timing, response = measure(call, repeat, clear_caches)
+            # The figures come from the figure cache once the view was built
+            cached, _ = measure(call, repeat)
+        # Dash sends the outputs encoded like this
+        size = len(json.dumps(list(response), cls=PlotlyJSONEncoder))
+        results.append(dict(group="update_figure", case=name, cached=cached["median"], bytes=size, **timing))
+    return results
+
+
+def environment():
+    """ Returns the versions the results were measured with """
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {"created": datetime.datetime.now().isoformat(timespec="seconds"),
+            "commit": commit,
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "versions": {"numpy": np.__version__, "pandas": pd.__version__,
+                         "plotly": plotly.__version__, "dash": dash.__version__}}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES, help="number of rows of the synthetic datasets")
+    parser.add_argument("--repeat", type=int, default=3, help="calls per case, the median is reported")
+    parser.add_argument("--groups", nargs="+", default=["generate_graph", "serialization", "interaction", "update_figure"])
+    parser.add_argument("--output", help="result file, by default a new file in " + RESULTS_DIR)
+    args = parser.parse_args(argv)
+
+    benches = {"generate_graph": bench_graphs, "serialization": bench_serialization, "interaction": bench_interaction,
+               "update_figure": bench_callback}
+    # The synthetic data follows the schema of the real dataset
+    template = app.catalog
+    report = dict(environment(), repeat=args.repeat, results=[])
+    for n_rows in args.sizes:
+        df = encode_categories(synthetic_frame(n_rows, template))
+        app.use_dataset(df)
+        for group in args.groups:
+            for result in benches[group](df, args.repeat):
+                result["rows"] = n_rows
+                report["results"].append(result)
+                print("{rows:>9} {group:<15} {case:<28} {median:9.4f} s".format(**result), flush=True)
+
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, "{}.json".format(time.strftime("%Y%m%d-%H%M%S")))
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print("Results written to", output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+from data_processing.catalog import QUANTILES
+from data_processing.store import DUMMY_COLUMN, RESULT_COLUMN, ROW_FILTER_COLUMN
+
+
+def synthetic_frame(n_rows, catalog, seed=0):
+    """ Returns a dataframe with the columns, types and missing values of the cataloged dataset
+
+    Numerical values are drawn from the quantiles of each column and categories with equal probability,
+    the columns are independent of each other.
+    """
+    rng = np.random.default_rng(seed)
+    columns = dict()
+    for column, entry in catalog.items():
+        # The preprocessing drops the rows without a red blood cell count
+        null_share = 0 if column == ROW_FILTER_COLUMN else entry["nulls"] / max(entry["nulls"] + entry["count"], 1)
+        missing = rng.random(n_rows) < null_share
+
+        if entry["kind"] == "float":
+            values = quantile_sample(rng, n_rows, entry).astype(entry["dtype"])
+            values[missing] = np.nan
+
+        elif entry["kind"] == "int":
+            values = rng.integers(entry["min"], entry["max"] + 1, n_rows).astype(entry["dtype"])
+
+        elif entry["kind"] == "object" and entry["identifier"]:
+            values = np.array(["{:015x}".format(i) for i in rng.permutation(n_rows)], dtype=object)
+
+        elif entry["kind"] == "object":
+            codes = rng.integers(0, len(entry["categories"]), n_rows)
+            codes[missing] = -1
+            values = pd.Categorical.from_codes(codes, categories=entry["categories"])
+
+        else:
+            values = np.zeros(n_rows, dtype=entry["dtype"])
+        columns[column] = values
+
+    frame = pd.DataFrame(columns, columns=list(catalog))
+    if RESULT_COLUMN in frame and DUMMY_COLUMN in frame:
+        # Like the preprocessing, the dummy column is 1 for a positive result
+        frame[DUMMY_COLUMN] = (frame[RESULT_COLUMN] == "positive").astype(catalog[DUMMY_COLUMN]["dtype"])
+    return frame
+
+
+def quantile_sample(rng, n_rows, entry):
+    """ Draws values whose distribution interpolates the cataloged minimum, quantiles and maximum """
+    probabilities = np.concatenate([[0], QUANTILES, [1]])
+    values = np.concatenate([[entry["min"]], entry["quantiles"], [entry["max"]]])
+    return np.interp(rng.random(n_rows), probabilities, values)
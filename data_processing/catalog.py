@@ -0,0 +1,70 @@
+import pandas as pd
+from data_processing.encoding import labels
+from data_processing.store import QUANTILES
+
+
+def column_kind(series):
+    """ Returns "float", "int" or "object" depending on the column type, None for other columns """
+    if pd.api.types.is_bool_dtype(series.dtype):
+        return None
+    elif pd.api.types.is_float_dtype(series.dtype):
+        return "float"
+    elif pd.api.types.is_integer_dtype(series.dtype):
+        return "int"
+    elif pd.api.types.is_object_dtype(series.dtype) or pd.api.types.is_categorical_dtype(series.dtype):
+        return "object"
+    return None
+
+
+def build_catalog(df, statistics=None):
+    """ Collects the metadata the option and filter callbacks need for every column, in column order
+
+    statistics are the counts, ranges and quantiles recorded by the store by column, the columns without them
+    are read one at a time.
+    """
+    catalog = dict()
+    for column in df.columns:
+        series = df[column]
+        kind = column_kind(series)
+        entry = {"kind": kind, "dtype": str(series.dtype)}
+        if statistics and column in statistics:
+            entry.update(statistics[column])
+        else:
+            entry.update(series_statistics(series, kind))
+
+        if kind == "object":
+            # The code → label table of the column, the filter slider refers to the categories by their codes
+            distinct = entry.pop("distinct", None)
+            categories = labels(series) if distinct is None else None
+            distinct = len(categories) if distinct is None else distinct
+            # Columns with a different value in every row (e.g. ids) can't be used as categories
+            entry["identifier"] = distinct == entry["count"] and entry["count"] > 1
+            if entry["identifier"]:
+                entry["categories"] = []
+            else:
+                entry["categories"] = list(labels(series) if categories is None else categories)
+
+        catalog[column] = entry
+    return catalog
+
+
+def series_statistics(series, kind):
+    """ Returns the null and non-null counts of a column, with the range and quantiles of numerical columns """
+    statistics = {"nulls": int(series.isna().sum()), "count": int(series.count())}
+    if kind in ("float", "int"):
+        # Plain Python numbers, they are sent to the browser as they are
+        statistics["min"] = series.min().item()
+        statistics["max"] = series.max().item()
+        statistics["quantiles"] = series.quantile(list(QUANTILES)).to_list()
+    return statistics
+
+
+def columns_of_kind(catalog, *kinds):
+    """ Returns the columns of the given kinds in column order, identifier columns are left out """
+    return [column for column, entry in catalog.items()
+            if entry["kind"] in kinds and not entry.get("identifier", False)]
+
+
+def options(columns):
+    """ Returns dropdown options for the columns """
+    return [{'label': value, 'value': value} for value in columns]
@@ -0,0 +1,45 @@
+import numpy as np
+import pandas as pd
+from data_processing.store import MAX_CATEGORIES
+
+
+def encode_categories(df, max_categories=MAX_CATEGORIES):
+    """ Returns the dataframe with its object columns converted to categoricals
+
+    The categories are kept in order of appearance, so the code of a value is its position in the slider marks.
+    Columns with more distinct values than max_categories stay text, categorical columns are kept as they are.
+    The store encodes the dataset as it writes it, this is for dataframes built in memory like the benchmark data.
+    """
+    encoded = dict()
+    for column in df.columns:
+        series = df[column]
+        if pd.api.types.is_object_dtype(series.dtype):
+            categories = pd.unique(series.dropna())
+            if len(categories) <= max_categories:
+                encoded[column] = pd.Categorical(series, categories=categories)
+    return df.assign(**encoded) if encoded else df
+
+
+def is_encoded(series):
+    return pd.api.types.is_categorical_dtype(series.dtype)
+
+
+def labels(series):
+    """ Returns the code → label table of a column, the label of code i is at position i """
+    if is_encoded(series):
+        return list(series.cat.categories)
+    return list(pd.unique(series.dropna()))
+
+
+def codes(series):
+    """ Returns the integer code of every row of a column, -1 for missing values """
+    if is_encoded(series):
+        return series.cat.codes.to_numpy()
+    return pd.factorize(series)[0]
+
+
+def observed_labels(series):
+    """ Returns the labels of the codes that occur in a column, in code order """
+    table = labels(series)
+    present = np.unique(codes(series))
+    return [table[code] for code in present[present >= 0]]
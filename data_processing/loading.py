@@ -0,0 +1,83 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+from data_processing.sources import CHUNK_ROWS, read_chunks
+from data_processing.store import build_store, is_complete, open_store, store_statistics
+
+
+# The dataset can be replaced by any file with a registered data source, e.g. a CSV or Parquet export
+DATASET_PATH = os.environ.get("CLINVIS_DATASET", os.path.join('data', 'dataset.xlsx'))
+CACHE_DIR = os.path.join('data', 'cache')
+
+
+def fingerprint(path, chunk_size=1 << 20):
+    """ Returns the content hash of a file """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cache_paths(path, digest, cache_dir=CACHE_DIR):
+    """ Returns the paths of the store built from a version of a dataset and of its metadata """
+    name = os.path.splitext(os.path.basename(path))[0]
+    return (os.path.join(cache_dir, "{}-{}".format(name, digest[:16])),
+            os.path.join(cache_dir, name + '.meta.json'))
+
+
+def load_dataset(path=DATASET_PATH, cache_dir=CACHE_DIR, downcast=True, chunk_rows=CHUNK_ROWS):
+    """ Loads the preprocessed dataset from its memory-mapped store, rebuilding the store if the file changed
+
+    Returns the dataframe and the statistics of its columns recorded in the store.
+    """
+    stat = os.stat(path)
+    meta_path = cache_paths(path, "", cache_dir)[1]
+    meta = None
+    if os.path.exists(meta_path):
+        with open(meta_path) as f:
+            meta = json.load(f)
+
+    if meta is not None and meta['mtime'] == stat.st_mtime and meta['size'] == stat.st_size:
+        digest = meta['sha256']
+    else:
+        # The modification time changed, only rebuild if the content did too
+        digest = fingerprint(path)
+
+    store_dir = cache_paths(path, digest, cache_dir)[0]
+    if not is_complete(store_dir):
+        # Build in a temporary directory so concurrently starting workers never open a partial store
+        temporary_dir = store_dir + '.{}.tmp'.format(os.getpid())
+        build_store(path, temporary_dir, lambda source: read_chunks(source, chunk_rows), downcast)
+        if is_complete(store_dir):
+            shutil.rmtree(temporary_dir)
+        else:
+            # A store of an earlier format is replaced
+            shutil.rmtree(store_dir, ignore_errors=True)
+            os.replace(temporary_dir, store_dir)
+        remove_old_stores(path, store_dir, cache_dir)
+
+    if meta is None or meta['sha256'] != digest or meta['mtime'] != stat.st_mtime:
+        write_meta(meta_path, stat, digest)
+    return open_store(store_dir), store_statistics(store_dir)
+
+
+def remove_old_stores(path, store_dir, cache_dir=CACHE_DIR):
+    """ Removes the stores of earlier versions of a dataset """
+    # Only the stores named like cache_paths() names them, e.g. not those of "data-2" when the dataset is "data"
+    pattern = re.escape(os.path.splitext(os.path.basename(path))[0]) + '-[0-9a-f]{16}'
+    for name in os.listdir(cache_dir):
+        old_dir = os.path.join(cache_dir, name)
+        if re.fullmatch(pattern, name) and old_dir != store_dir:
+            # Processes that still map the old files keep them until they exit
+            shutil.rmtree(old_dir, ignore_errors=True)
+
+
+def write_meta(meta_path, stat, digest):
+    """ Records which version of the dataset the store was built from """
+    temporary_path = meta_path + '.{}.tmp'.format(os.getpid())
+    with open(temporary_path, 'w') as f:
+        json.dump({'mtime': stat.st_mtime, 'size': stat.st_size, 'sha256': digest}, f)
+    os.replace(temporary_path, meta_path)
@@ -0,0 +1,61 @@
+import os
+import pandas as pd
+
+
+# Number of rows read at a time
+CHUNK_ROWS = 100000
+
+
+def read_excel_chunks(path, chunk_rows=CHUNK_ROWS):
+    """ Streams the first sheet of a workbook, the first row holds the column names """
+    # openpyxl is only needed when a workbook is read
+    import openpyxl
+
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = list(next(rows))
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) == chunk_rows:
+                yield pd.DataFrame.from_records(chunk, columns=header)
+                chunk = []
+        if chunk:
+            yield pd.DataFrame.from_records(chunk, columns=header)
+    finally:
+        workbook.close()
+
+
+def read_csv_chunks(path, chunk_rows=CHUNK_ROWS):
+    """ Streams a CSV file """
+    for chunk in pd.read_csv(path, chunksize=chunk_rows):
+        yield chunk
+
+
+def read_parquet_chunks(path, chunk_rows=CHUNK_ROWS):
+    """ Streams a Parquet file one row group at a time """
+    import pyarrow.parquet as pq
+
+    parquet_file = pq.ParquetFile(path)
+    for i in range(parquet_file.num_row_groups):
+        yield parquet_file.read_row_group(i).to_pandas()
+
+
+# Readers by file extension, register_source() adds more
+SOURCES = {".xlsx": read_excel_chunks,
+           ".csv": read_csv_chunks,
+           ".parquet": read_parquet_chunks}
+
+
+def register_source(extension, reader):
+    """ Registers a reader, a function of a path and a chunk size that yields dataframes """
+    SOURCES[extension.lower()] = reader
+
+
+def read_chunks(path, chunk_rows=CHUNK_ROWS):
+    """ Streams a dataset with the reader registered for its extension """
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in SOURCES:
+        raise ValueError("No data source registered for {} files".format(extension))
+    return SOURCES[extension](path, chunk_rows)
@@ -0,0 +1,277 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_bool_dtype, is_float_dtype, is_integer_dtype
+
+
+# The preprocessing applied to every dataset
+ROW_FILTER_COLUMN = "Red blood Cells"
+RESULT_COLUMN = "SARS-Cov-2 exam result"
+DUMMY_COLUMN = "COVID-19"
+# Object columns with more distinct values than this are kept as text instead of categories
+MAX_CATEGORIES = 10000
+# Quantiles recorded for every numerical column
+QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+# Stores written in an earlier format are rebuilt
+STORE_VERSION = 3
+
+
+def filter_rows(chunk):
+    """ Keeps the rows that have a red blood cell count """
+    return chunk[chunk[ROW_FILTER_COLUMN].notna()]
+
+
+def as_text(series):
+    """ Converts the values of an object column to text, keeping the missing values """
+    return series.where(series.isna(), series.astype(str))
+
+
+def scan(chunks, schema=None):
+    """ Collects the kind, non-null count, categories and range of every column of the streamed chunks
+
+    Pass the result of a previous scan as schema to only collect the categories of its object columns.
+    """
+    columns = schema or dict()
+    for chunk in chunks:
+        if schema is None:
+            # Columns are dropped if they are empty before the rows are filtered, like dropna(how="all", axis=1)
+            for column in chunk.columns:
+                info = columns.setdefault(column, {"kinds": set(), "count": 0, "nulls": 0, "rows": 0,
+                                                   "categories": dict(), "width": 0, "min": None, "max": None})
+                info["count"] += int(chunk[column].count())
+
+        kept = filter_rows(chunk)
+        for column in kept.columns:
+            info = columns[column]
+            series = kept[column].dropna()
+            if schema is None:
+                info["nulls"] += len(kept) - len(series)
+                info["rows"] += len(kept)
+            if len(series) == 0:
+                continue
+
+            kind = chunk_kind(series)
+            if schema is not None and column_kind(info) != "object":
+                continue
+            info["kinds"].add(kind)
+            if kind == "object" or schema is not None:
+                text = as_text(series)
+                # The UTF-8 length of the longest value, columns with too many categories are stored with this width
+                info["width"] = max(info["width"], int(text.str.encode("utf-8").str.len().max()))
+                for value in pd.unique(text):
+                    if len(info["categories"]) > MAX_CATEGORIES:
+                        break
+                    info["categories"].setdefault(value, len(info["categories"]))
+            elif kind != "bool":
+                low, high = series.min(), series.max()
+                info["min"] = low if info["min"] is None else min(info["min"], low)
+                info["max"] = high if info["max"] is None else max(info["max"], high)
+    return columns
+
+
+def chunk_kind(series):
+    if is_bool_dtype(series.dtype):
+        return "bool"
+    elif is_float_dtype(series.dtype):
+        return "float"
+    elif is_integer_dtype(series.dtype):
+        return "int"
+    return "object"
+
+
+def column_kind(info):
+    """ Resolves the kind of a column from the kinds seen in its chunks """
+    kinds = info["kinds"]
+    if "object" in kinds:
+        return "object"
+    elif "float" in kinds or ("int" in kinds and info["nulls"] > 0) or not kinds:
+        return "float"
+    elif kinds == {"bool"}:
+        return "bool"
+    return "int"
+
+
+def storage_dtype(info, downcast=True):
+    """ Returns the numpy type a column is stored with """
+    kind = column_kind(info)
+    if kind == "float":
+        return np.dtype(np.float32 if downcast else np.float64)
+    elif kind == "bool":
+        return np.dtype(bool)
+    elif kind == "int":
+        if not downcast:
+            return np.dtype(np.int64)
+        for dtype in (np.int8, np.int16, np.int32):
+            if np.iinfo(dtype).min <= info["min"] and info["max"] <= np.iinfo(dtype).max:
+                return np.dtype(dtype)
+        return np.dtype(np.int64)
+
+    # Object columns are stored as category codes, or as fixed width UTF-8 text if they have too many categories
+    if len(info["categories"]) > MAX_CATEGORIES:
+        return np.dtype("S{}".format(max(info["width"], 1)))
+    for dtype in (np.int8, np.int16, np.int32):
+        if len(info["categories"]) < np.iinfo(dtype).max:
+            return np.dtype(dtype)
+
+
+def build_store(path, store_dir, read_chunks, downcast=True):
+    """ Streams a dataset into a directory with one memory-mappable .npy file per column
+
+    read_chunks(path) must return a new iterator of dataframes on every call. The data is read twice:
+    once to find the schema and once to write the preprocessed rows. Float columns are stored as float32
+    and integer columns in the smallest integer type if downcast is set, object columns as category codes
+    or, if they have too many categories, as fixed width UTF-8 text in which missing values are empty.
+    """
+    columns = scan(read_chunks(path))
+    # A column can be numerical in one chunk and text in another, then its categories are collected again
+    if any(column_kind(info) == "object" and info["kinds"] != {"object"} for info in columns.values()):
+        for info in columns.values():
+            info["categories"] = dict()
+        columns = scan(read_chunks(path), columns)
+
+    # The dummy column is derived from the result, one already in the dataset is replaced like df[DUMMY_COLUMN] = ...
+    kept = [column for column, info in columns.items() if info["count"] > 0 and column != DUMMY_COLUMN]
+    n_rows = columns[ROW_FILTER_COLUMN]["rows"]
+    # The dummy is 1 for the second result in sorted order, like pd.get_dummies(drop_first=True)
+    results = sorted(columns[RESULT_COLUMN]["categories"])
+    positive = results[1] if len(results) > 1 else None
+
+    os.makedirs(store_dir, exist_ok=True)
+    meta = {"version": STORE_VERSION, "rows": n_rows, "columns": []}
+    arrays = dict()
+    for i, column in enumerate(kept + [DUMMY_COLUMN]):
+        if column == DUMMY_COLUMN:
+            kind, dtype = "int", np.dtype(np.uint8)
+        else:
+            kind, dtype = column_kind(columns[column]), storage_dtype(columns[column], downcast)
+        entry = {"name": column, "kind": kind, "dtype": dtype.str, "file": "{}.npy".format(i)}
+        if kind == "object":
+            entry["text"] = len(columns[column]["categories"]) > MAX_CATEGORIES
+            if not entry["text"]:
+                entry["categories"] = list(columns[column]["categories"])
+        arrays[column] = np.lib.format.open_memmap(os.path.join(store_dir, entry["file"]), mode="w+",
+                                                   dtype=dtype, shape=(n_rows,))
+        meta["columns"].append(entry)
+
+    # Second pass: write the preprocessed chunks into the columns
+    start = 0
+    for chunk in read_chunks(path):
+        chunk = filter_rows(chunk)
+        end = start + len(chunk)
+        for entry in meta["columns"]:
+            column = entry["name"]
+            if column == DUMMY_COLUMN:
+                values = (chunk[RESULT_COLUMN] == positive).to_numpy(dtype=np.uint8)
+            elif entry["kind"] == "object":
+                text = as_text(chunk[column])
+                if entry["text"]:
+                    values = text.fillna("").str.encode("utf-8").to_numpy(dtype=np.dtype(entry["dtype"]))
+                else:
+                    values = pd.Categorical(text, categories=entry["categories"]).codes
+            else:
+                values = chunk[column].to_numpy(dtype=np.dtype(entry["dtype"]))
+            arrays[column][start:end] = values
+        start = end
+
+    # The statistics of the catalog are computed one column at a time, so it never reads the whole dataset at once
+    for entry in meta["columns"]:
+        arrays[entry["name"]].flush()
+        entry["statistics"] = column_statistics(entry, arrays[entry["name"]])
+    arrays.clear()
+
+    # The metadata is written last, a store without it is incomplete
+    with open(os.path.join(store_dir, "meta.json"), "w") as f:
+        json.dump(meta, f)
+
+
+def column_statistics(entry, column):
+    """ Returns the null and non-null counts of a stored column, with the range and quantiles of numerical columns
+
+    Text columns have the number of distinct values instead, a different value in every row marks an identifier.
+    """
+    if entry["kind"] == "object":
+        present = column[column != b""] if entry.get("text") else column[column >= 0]
+    elif entry["kind"] == "float":
+        present = column[~np.isnan(column)]
+    else:
+        present = np.asarray(column)
+    statistics = {"nulls": len(column) - len(present), "count": len(present)}
+
+    if entry["kind"] == "object" and entry.get("text"):
+        statistics["distinct"] = len(np.unique(present))
+    elif entry["kind"] in ("float", "int"):
+        if len(present):
+            statistics["min"], statistics["max"] = present.min().item(), present.max().item()
+            statistics["quantiles"] = [value.item() for value in np.quantile(present, QUANTILES)]
+        else:
+            statistics["min"], statistics["max"] = np.nan, np.nan
+            statistics["quantiles"] = [np.nan] * len(QUANTILES)
+    return statistics
+
+
+def store_statistics(store_dir):
+    """ Returns the statistics of the columns of a store by column name """
+    with open(os.path.join(store_dir, "meta.json")) as f:
+        meta = json.load(f)
+    return {entry["name"]: entry["statistics"] for entry in meta["columns"]}
+
+
+def is_complete(store_dir):
+    """ Returns True if the store was fully written in the current format """
+    meta_path = os.path.join(store_dir, "meta.json")
+    if not os.path.exists(meta_path):
+        return False
+    with open(meta_path) as f:
+        return json.load(f).get("version") == STORE_VERSION
+
+
+def open_store(store_dir):
+    """ Opens a store as a dataframe whose numerical columns are memory-mapped from disk
+
+    Text columns are decoded into Python strings, pandas has no type that could keep them mapped.
+    """
+    with open(os.path.join(store_dir, "meta.json")) as f:
+        meta = json.load(f)
+
+    names, values = [], []
+    for entry in meta["columns"]:
+        column = np.load(os.path.join(store_dir, entry["file"]), mmap_mode="r")
+        if entry["kind"] == "object" and entry.get("text"):
+            column = decode_text(column)
+        names.append(entry["name"])
+        values.append((entry, column))
+
+    try:
+        import pyarrow as pa
+    except ImportError:
+        # Without pyarrow the columns are read into memory
+        return pd.DataFrame({name: to_series(entry, column) for name, (entry, column) in zip(names, values)},
+                            columns=names)
+
+    # Arrow wraps the mapped arrays without copying them and converts them back to one block per column,
+    # so pandas doesn't consolidate (and copy) them
+    arrays = []
+    for entry, column in values:
+        if entry["kind"] == "object" and not entry.get("text"):
+            codes = np.asarray(column)
+            arrays.append(pa.DictionaryArray.from_arrays(pa.array(codes, mask=codes < 0),
+                                                         pa.array(entry["categories"], type=pa.string())))
+        else:
+            arrays.append(pa.array(column))
+    return pa.Table.from_arrays(arrays, names=names).to_pandas(split_blocks=True)
+
+
+def to_series(entry, column):
+    if entry["kind"] == "object" and not entry.get("text"):
+        return pd.Categorical.from_codes(np.asarray(column), categories=entry["categories"])
+    return np.asarray(column)
+
+
+def decode_text(column, block_rows=100000):
+    """ Decodes a fixed width text column block by block, empty values are missing """
+    text = np.empty(len(column), dtype=object)
+    for start in range(0, len(column), block_rows):
+        block = pd.Series(column[start:start + block_rows]).str.decode("utf-8")
+        text[start:start + len(block)] = block.where(block != "", None).to_numpy()
+    return text
@@ -0,0 +1,147 @@
+import numpy as np
+
+
+# Upper limit for the number of bins along an axis
+MAX_BINS = 200
+# Aggregation functions for the values of a third column in each bin
+AGGREGATIONS = ("count", "sum", "mean", "median")
+# Above this number of values the spread used by the "auto" binning rule is estimated on a sample
+EDGE_SAMPLE = 100000
+
+
+def bin_edges(values, bins="auto", max_bins=MAX_BINS):
+    """ Returns evenly spaced bin edges for the finite values, bins is a number of bins or a numpy binning rule
+
+    For many values only their range is read from all of them, the binning rule from an evenly spaced sample.
+    """
+    values = np.asarray(values, dtype=float).ravel(order="K")
+    finite = np.isfinite(values)
+    n_values = np.count_nonzero(finite)
+    if n_values == 0:
+        return np.array([0.0, 1.0])
+
+    if n_values > EDGE_SAMPLE:
+        value_range = (np.nanmin(values), np.nanmax(values))
+        if not np.isfinite(value_range).all():
+            value_range = (values[finite].min(), values[finite].max())
+        sample = values[::len(values) // EDGE_SAMPLE]
+        sample = sample[np.isfinite(sample)]
+        if isinstance(bins, str) and bins == "auto":
+            bins = auto_bin_count(sample, n_values, value_range)
+        edges = np.histogram_bin_edges(sample, bins=bins, range=value_range)
+    else:
+        edges = np.histogram_bin_edges(values[finite], bins=bins)
+
+    if len(edges) > max_bins + 1:
+        edges = np.linspace(edges[0], edges[-1], max_bins + 1)
+    return edges
+
+
+def auto_bin_count(sample, n_values, value_range):
+    """ Returns the number of bins numpy's "auto" rule picks for n_values, with the quartiles of a sample """
+    low, high = value_range
+    if low == high:
+        return 1
+    q1, q3 = np.percentile(sample, [25, 75])
+    # The smaller of the Freedman-Diaconis and Sturges bin widths, Sturges if the quartiles are equal
+    sturges = (high - low) / (np.log2(n_values) + 1)
+    width = min(2 * (q3 - q1) * n_values ** (-1 / 3), sturges) if q3 > q1 else sturges
+    return int(np.ceil((high - low) / width))
+
+
+def bin_1d(values, edges):
+    """ Returns the number of finite values in every bin of evenly spaced edges """
+    values = np.asarray(values, dtype=float)
+    # With a number of bins and a range np.histogram computes the bins instead of searching them
+    return np.histogram(values[np.isfinite(values)], bins=len(edges) - 1, range=(edges[0], edges[-1]))[0]
+
+
+def bin_groups(values, edges, groups=None, n_groups=1):
+    """ Counts the finite values of every group in every bin, the result has one row per group
+
+    values is a 2-D array with one column per group, or a 1-D array with the group of every value in groups
+    (-1 for none). The edges have to be evenly spaced and span all the values.
+    """
+    values = np.asarray(values, dtype=float)
+    if values.ndim == 2:
+        # np.histogram computes the bins of evenly spaced edges in C, a column at a time is as fast as it gets
+        return np.array([bin_1d(values[:, i], edges) for i in range(values.shape[1])]).reshape(-1, len(edges) - 1)
+    if groups is None:
+        return bin_1d(values, edges)[np.newaxis]
+
+    # The groups are counted together in one pass, every group has an extra bin for the values that are not counted
+    n_bins = len(edges) - 1
+    groups = np.asarray(groups)
+    index = uniform_bin_index(values, edges)
+    index[~np.isfinite(values) | (groups < 0)] = n_bins
+    cells = np.maximum(groups, 0) * (n_bins + 1) + index
+    counts = np.bincount(cells, minlength=n_groups * (n_bins + 1))
+    return counts.reshape(n_groups, n_bins + 1)[:, :n_bins]
+
+
+def bin_2d(x, y, x_edges, y_edges, z=None, func="count"):
+    """ Aggregates the rows into a grid of bins, the result has one row per y bin and one column per x bin
+
+    Cells without rows are NaN for every function except "count".
+    """
+    if func not in AGGREGATIONS:
+        raise ValueError("Unknown aggregation function: {}".format(func))
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    valid = np.isfinite(x) & np.isfinite(y)
+    if func != "count":
+        z = np.asarray(z, dtype=float)
+        valid &= np.isfinite(z)
+        z = z[valid]
+    x, y = x[valid], y[valid]
+
+    counts = np.histogram2d(y, x, bins=[y_edges, x_edges])[0]
+    if func == "count":
+        return counts
+
+    if func in ("sum", "mean"):
+        sums = np.histogram2d(y, x, bins=[y_edges, x_edges], weights=z)[0]
+        if func == "sum":
+            return np.where(counts > 0, sums, np.nan)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(counts > 0, sums / counts, np.nan)
+
+    # Median: sort the rows by cell and value, then read the middle of every cell
+    n_x, n_y = len(x_edges) - 1, len(y_edges) - 1
+    cells = bin_index(y, y_edges) * n_x + bin_index(x, x_edges)
+    order = np.lexsort((z, cells))
+    cells, z = cells[order], z[order]
+    starts = np.searchsorted(cells, np.arange(n_x * n_y), side="left")
+    sizes = np.searchsorted(cells, np.arange(n_x * n_y), side="right") - starts
+
+    medians = np.full(n_x * n_y, np.nan)
+    filled = sizes > 0
+    lower = z[starts[filled] + (sizes[filled] - 1) // 2]
+    upper = z[starts[filled] + sizes[filled] // 2]
+    medians[filled] = (lower + upper) / 2
+    return medians.reshape(n_y, n_x)
+
+
+def bin_index(values, edges):
+    """ Returns the bin of every value, the last bin includes its right edge like np.histogram """
+    return np.clip(np.searchsorted(edges, values, side="right") - 1, 0, len(edges) - 2)
+
+
+def uniform_bin_index(values, edges):
+    """ Returns the bin of every value for evenly spaced edges, computed instead of searched like np.histogram does
+
+    Values outside the edges are put in the first or last bin, the bin of NaNs is undefined.
+    """
+    n_bins = len(edges) - 1
+    with np.errstate(invalid="ignore"):
+        index = ((values - edges[0]) * (n_bins / (edges[-1] - edges[0]))).astype(np.intp)
+    np.clip(index, 0, n_bins - 1, out=index)
+    # Rounding can put a value next to an edge into the neighbouring bin
+    index -= values < edges[index]
+    index += (values >= edges[index + 1]) & (index < n_bins - 1)
+    return index
+
+
+def bin_centers(edges):
+    return (edges[:-1] + edges[1:]) / 2
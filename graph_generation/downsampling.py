@@ -0,0 +1,64 @@
+import numpy as np
+
+
+# Above this number of points scatter plots are drawn with WebGL instead of SVG
+WEBGL_THRESHOLD = 1000
+# Share of points at each end of an axis that are always kept as outliers
+OUTLIER_QUANTILE = 0.001
+
+
+def downsample(x, y, max_points, keep=None, grid_size=64, seed=0):
+    """ Returns the sorted positions of about max_points points that preserve the density of the data
+
+    The points are binned into a grid and every occupied cell keeps a share of its points proportional
+    to its count, but at least one, so sparse regions stay visible. Points flagged in keep (e.g. the
+    selected ones) and the outliers of both axes are always kept.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    if len(x) <= max_points:
+        return np.arange(len(x))
+
+    valid = np.isfinite(x) & np.isfinite(y)
+    forced = np.zeros(len(x), dtype=bool) if keep is None else np.asarray(keep, dtype=bool).copy()
+    for values in (x, y):
+        low, high = np.quantile(values[valid], [OUTLIER_QUANTILE, 1 - OUTLIER_QUANTILE])
+        forced |= valid & ((values < low) | (values > high))
+
+    # Bin the remaining points into the grid
+    candidates = np.flatnonzero(valid & ~forced)
+    cells = (grid_cell(x[candidates], grid_size) * grid_size + grid_cell(y[candidates], grid_size))
+
+    # Shuffle first so the points kept in a cell are a random sample of it
+    candidates_order = np.random.RandomState(seed).permutation(len(candidates))
+    candidates_order = candidates_order[np.argsort(cells[candidates_order], kind="stable")]
+    sorted_cells = cells[candidates_order]
+
+    budget = max(max_points - forced.sum(), 0)
+    occupied, starts, counts = np.unique(sorted_cells, return_index=True, return_counts=True)
+    quotas = np.maximum(1, np.round(counts * budget / max(len(candidates), 1))).astype(int)
+    rank = np.arange(len(sorted_cells)) - np.repeat(starts, counts)
+    kept = candidates[candidates_order[rank < np.repeat(quotas, counts)]]
+
+    return np.union1d(kept, np.flatnonzero(forced))
+
+
+def grid_cell(values, grid_size):
+    """ Returns the grid column of every value, the grid spans the range of the values """
+    if len(values) == 0:
+        return np.zeros(0, dtype=int)
+    low, high = values.min(), values.max()
+    if high == low:
+        return np.zeros(len(values), dtype=int)
+    return np.minimum(((values - low) / (high - low) * grid_size).astype(int), grid_size - 1)
+
+
+def padded_range(values, padding=0.05):
+    """ Returns an axis range that shows all finite values """
+    values = np.asarray(values, dtype=float)
+    values = values[np.isfinite(values)]
+    if len(values) == 0:
+        return None
+    low, high = values.min(), values.max()
+    margin = (high - low) * padding or 1
+    return [low - margin, high + margin]
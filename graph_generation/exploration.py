@@ -1,9 +1,180 @@
 import numpy as np
 import pandas as pd
-from sklearn.cluster import KMeans
+from graph_generation.cache import LRUCache, rows_fingerprint
 
 
-def cluster(data, variable, n_clusters):
-    X = np.array([data[variable].dropna()]).reshape(-1, 1)
-    kmeans = KMeans(n_clusters=n_clusters, random_state=0).fit(X)
-    return kmeans.labels_
\ No newline at end of file
+# Above this number of rows MiniBatchKMeans is used in the "auto" mode
+MINI_BATCH_ROWS = 100000
+
+# Fitted models keyed by variables, number of clusters, mode, scaling and the clustered rows
+models = LRUCache(max_entries=64, max_bytes=256 * 2**20, sizeof=lambda model: model["labels"].nbytes)
+# The centroids fitted last for each set of variables, used to warm-start the next fit
+last_centers = dict()
+
+
+def cluster(data, variables, n_clusters, mode="auto", scale=False, start=None):
+    """ Clusters the rows on one or more variables and returns the labels indexed like the data
+
+    mode is "auto" (optimal breaks for one variable, k-means otherwise), "exact", "kmeans" or "minibatch".
+    start is where k-means starts from, see cluster_model.
+    """
+    # Rows with a missing value get no label
+    return cluster_model(data, variables, n_clusters, mode, scale, start)["labels"]
+
+
+def cluster_model(data, variables, n_clusters, mode="auto", scale=False, start=None):
+    """ Returns the labels of cluster() and, for k-means, the centroids and the start they were fitted from
+
+    The start is "k-means++" or a list of initial centroids, by default it is derived from the centroids fitted
+    last for the variables. The same start gives the same clusters, so a view that keeps the start of its model
+    can be clustered again after the model was evicted, whatever was fitted in between.
+    """
+    if isinstance(variables, str):
+        variables = [variables]
+    values = data[variables].dropna()
+    key = (tuple(variables), n_clusters, mode, scale, rows_fingerprint(values.index))
+
+    model = models.get(key)
+    if model is not None and start is not None and not same_start(model.get("start"), start):
+        # The cached model was fitted from another start
+        model = None
+    if model is None:
+        X = values.to_numpy(dtype=float)
+        if scale and len(X):
+            X = standardize(X)
+
+        if len(X) == 0:
+            # e.g. the filter left no rows with all the variables
+            model = {"labels": np.zeros(0, dtype=int)}
+        elif len(variables) == 1 and mode in ("auto", "exact"):
+            model = {"labels": optimal_breaks_1d(X[:, 0], n_clusters)}
+        else:
+            if start is None:
+                previous_centers = last_centers.get((tuple(variables), scale))
+                start = warm_start(X, n_clusters, previous_centers) if previous_centers is not None else "k-means++"
+            model = fit(X, n_clusters, mode, start)
+            last_centers[(tuple(variables), scale)] = model["centers"]
+        model["labels"] = pd.Series(model["labels"], index=values.index)
+        models.put(key, model)
+    return model
+
+
+def same_start(start, other):
+    """ Returns True if two starts of k-means are the same """
+    if isinstance(start, str) or isinstance(other, str) or start is None:
+        return start == other
+    return np.array_equal(np.asarray(start, dtype=float), np.asarray(other, dtype=float))
+
+
+def standardize(X):
+    """ Scales every column to zero mean and unit variance """
+    std = X.std(axis=0)
+    std[std == 0] = 1
+    return (X - X.mean(axis=0)) / std
+
+
+def fit(X, n_clusters, mode="auto", start="k-means++"):
+    """ Fits k-means from start, "k-means++" or initial centroids, and returns the labels, centroids and start """
+    # scikit-learn is slow to import, it is only loaded once a clustering is requested
+    from sklearn.cluster import KMeans, MiniBatchKMeans
+
+    init = start if isinstance(start, str) else np.asarray(start, dtype=float)
+    n_init = 10 if isinstance(start, str) else 1
+
+    if mode == "minibatch" or (mode == "auto" and len(X) > MINI_BATCH_ROWS):
+        kmeans = MiniBatchKMeans(n_clusters=n_clusters, init=init, n_init=n_init, random_state=0).fit(X)
+    else:
+        kmeans = KMeans(n_clusters=n_clusters, init=init, n_init=n_init, random_state=0).fit(X)
+    # The clusters are numbered in the lexicographic order of their centroids, not in the order of the start
+    order = np.lexsort(kmeans.cluster_centers_.T[::-1])
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    return {"labels": rank[kmeans.labels_], "centers": kmeans.cluster_centers_[order],
+            "start": start if isinstance(start, str) else init.tolist()}
+
+
+def warm_start(X, n_clusters, previous_centers):
+    """ Derives initial centroids for n_clusters from the centroids of a previous fit """
+    centers = previous_centers[np.lexsort(previous_centers.T[::-1])]
+    if n_clusters <= len(centers):
+        # Keep centroids spread evenly over the previous ones
+        return centers[np.linspace(0, len(centers) - 1, n_clusters).round().astype(int)]
+
+    # Add centroids at quantiles of the data for the missing clusters
+    quantiles = np.quantile(X, np.linspace(0, 1, n_clusters - len(centers) + 2)[1:-1], axis=0)
+    return np.concatenate([centers, quantiles])
+
+
+def optimal_breaks_1d(x, n_clusters):
+    """ Clusters one variable by minimizing the within-cluster sum of squares
+
+    The sorted distinct values are split with dynamic programming, so the result is exact, deterministic and
+    the labels are ordered by value.
+    """
+    if len(x) == 0:
+        return np.zeros(0, dtype=int)
+    # The segment costs subtract large sums, centering keeps them precise for values far from zero
+    values, inverse, counts = np.unique(x - x.mean(), return_inverse=True, return_counts=True)
+    breaks = segment_1d(counts, counts * values, counts * values**2, min(n_clusters, len(values)))
+    return np.searchsorted(breaks, np.arange(len(values)), side="right")[inverse]
+
+
+def segment_1d(weights, sums, squares, n_segments):
+    """ Returns the start positions of the segments 2..n of the optimal split of weighted sorted points
+
+    Where the last segment best starts never decreases with where it ends, so every segment added is solved by
+    divide and conquer over the ends: O(n log n) time and O(n) memory per segment, for n distinct values.
+    """
+    W = np.concatenate([[0], np.cumsum(weights)])
+    S = np.concatenate([[0], np.cumsum(sums)])
+    Q = np.concatenate([[0], np.cumsum(squares)])
+
+    def cost(j, i):
+        # The sum of squares of the points j..i-1
+        return Q[i] - Q[j] - (S[i] - S[j])**2 / (W[i] - W[j])
+
+    # best[i] is the cost of the best split of the first i points
+    n = len(weights)
+    best = np.concatenate([[np.inf], cost(np.zeros(n, dtype=int), np.arange(1, n + 1))])
+    starts = []
+    for segments in range(2, n_segments + 1):
+        best, start = add_segment(best, cost, segments, n)
+        starts.append(start)
+
+    # Walk back from the last point to recover where every segment starts
+    breaks = []
+    end = n
+    for start in reversed(starts):
+        end = start[end]
+        breaks.append(end)
+    return np.array(breaks[::-1], dtype=int)
+
+
+def add_segment(previous, cost, segments, n):
+    """ Returns the best cost of splitting the first i points in one more segment and where the last one starts
+
+    previous are the best costs with one segment less. The ends of one level of the divide and conquer are
+    solved together: the ends lo..hi, whose last segment starts between low and high, are split at their middle.
+    """
+    best = np.full(n + 1, np.inf)
+    start = np.zeros(n + 1, dtype=int)
+    lo, hi, low, high = np.array([segments]), np.array([n]), np.array([segments - 1]), np.array([n - 1])
+    while len(lo):
+        mid = (lo + hi) // 2
+        counts = np.minimum(high, mid - 1) - low + 1
+        offsets = np.cumsum(counts) - counts
+        # The candidate starts of all the middles one after the other
+        j = np.arange(counts.sum()) + np.repeat(low - offsets, counts)
+        total = previous[j] + cost(j, np.repeat(mid, counts))
+
+        # The first start with the lowest cost for every middle
+        lowest = np.minimum.reduceat(total, offsets)
+        candidates = np.flatnonzero(total == np.repeat(lowest, counts))
+        owner = np.searchsorted(offsets, candidates, side="right")
+        arg = j[candidates[np.concatenate([[True], np.diff(owner) > 0])]]
+        best[mid], start[mid] = lowest, arg
+
+        left, right = mid > lo, mid < hi
+        lo, hi = np.concatenate([lo[left], mid[right] + 1]), np.concatenate([mid[left] - 1, hi[right]])
+        low, high = np.concatenate([low[left], arg[right]]), np.concatenate([arg[left], high[right]])
+    return best, start
@@ -1,8 +1,16 @@
 import plotly.express as px
 import plotly.graph_objs as go
 import pandas as pd
+import numpy as np
 from itertools import zip_longest
 import plotly.io as pio
+from plotly.subplots import make_subplots
+from graph_generation.aggregation import bin_edges, bin_groups, bin_2d, bin_centers
+from graph_generation.downsampling import WEBGL_THRESHOLD, downsample, padded_range
+from graph_generation.regression import trendline, fit_key
+from graph_generation.traces import build_traces, column_arrays
+from graph_generation.statistics import ranked_pairs, select_columns
+from data_processing.encoding import is_encoded, observed_labels
 
 pio.templates.default = "plotly_white"
 
@@ -10,16 +18,13 @@ pio.templates.default = "plotly_white"
 def generate_graph(data, x="Red blood Cells", y="Paletes", z="Leukocytes", graph_type='scatter', selected_points=[], *args, **kwargs):
     """ Generates and returns a graph with the specified arguments """
 
-    # Return an empty figure if the input is empty
-    if x == [] and y==[]:
+    # Return an empty figure if the input is empty, the correlation overview then shows all columns
+    if x == [] and y==[] and graph_type != "correlation":
         return go.Figure()
-    
-    # Transform the data into wide format
-    melted = pd.melt(data, value_vars=data.columns)
 
     if graph_type=="histogram":
         if len(x) > 1:
-            return generate_histogram(melted, x, y, "wide", **kwargs)
+            return generate_histogram(data, x, y, "wide", **kwargs)
         elif len(x) == 0:
             return go.Figure()
         return generate_histogram(data, x, y, "long", **kwargs)
@@ -29,16 +34,16 @@ def generate_graph(data, x="Red blood Cells", y="Paletes", z="Leukocytes", graph
             return generate_scatter(data, x[0], y[0], "long", selected_points=selected_points, **kwargs)
 
         elif len(x) > 1 or len(y) > 1:
-            return generate_scatter_matrix(data, x, y, data_format="long", **kwargs)
+            return generate_scatter_matrix(data, x, y, data_format="long", selected_points=selected_points, **kwargs)
 
-        return generate_scatter(melted, x, y, "wide")
+        return generate_scatter(data, x, y, "wide")
 
-    elif graph_type=="box":
-        return generate_box_plot(data, x, "long", **kwargs)
+    elif graph_type=="box_summary":
+        return generate_box_summary(x, **kwargs)
 
     elif graph_type=="heatmap":
         if len(x) > 0 and len(y) > 0:
-            return generate_heatmap(data, x, y, "long", **kwargs)
+            return generate_heatmap(data, x, y, z, "long", **kwargs)
         return go.Figure()
 
     elif graph_type=="par_coords":
@@ -54,56 +59,71 @@ def generate_graph(data, x="Red blood Cells", y="Paletes", z="Leukocytes", graph
             return generate_ternary(data, x, y, z, "long", **kwargs)
         return go.Figure()
 
+    elif graph_type=="correlation":
+        if "matrix" in kwargs:
+            return generate_correlation(x, **kwargs)
+        return go.Figure()
+
 
 ################################### HISTOGRAM ###################################
 
 
-def generate_histogram(data, x, y, data_format="wide", orientation='v', **kwargs):
-    """ Generates and returns a histogram """
+def generate_histogram(data, x, y, data_format="wide", orientation='v', nbins="auto", color=None, **kwargs):
+    """ Generates and returns a histogram, the bins of all traces are counted here in one pass and drawn as bars """
     if data_format == "wide":
-        fig = go.Figure()
+        # One trace per attribute provided in the X Axis dropdown, read straight from the wide columns
+        names = list(x)
+        values = data[names].to_numpy(dtype=float)
+        groups, n_groups = None, len(names)
 
-        # Iterate over attributes provided in the X Axis dropdown and add traces with histograms
-        for attribute in x:
-            # Flip axes depending on orientation
-            if orientation == "v":
-                x_axis = data["value"][data["variable"] == attribute]
-                y_axis = data["variable"][data["variable"] == attribute]
-            else:
-                y_axis = data["value"][data["variable"] == attribute]
-                x_axis = data["variable"][data["variable"] == attribute]
-            
-            fig.add_trace(go.Histogram(
-                x=x_axis,
-                y=y_axis,
-                name=attribute,
-                orientation=orientation
-                )
-            )
-        # Make the histograms visible if they overlap
-        fig.update_layout(barmode='overlay', xaxis_title="Value", yaxis_title="Frequency")
-        if orientation == "h":
-            fig.update_layout(xaxis_title="Frequency", yaxis_title="Value")
-        fig.update_traces(opacity=0.8)
-        return fig
-    
     elif data_format == "long":
-        if orientation == "h":
-            fig = px.histogram(data, y=x, **kwargs)
-            fig.update_layout(barmode='overlay', xaxis_title="Frequency", yaxis_title="Value")
-
+        values = data[x[0]].to_numpy(dtype=float)
+        if color is None:
+            names = [x[0]]
+            groups, n_groups = None, 1
         else:
-            fig = px.histogram(data, x=x, **kwargs)
-            fig.update_layout(barmode='overlay', xaxis_title="Value", yaxis_title="Frequency")
-        
-        return fig
+            # One trace per value of the color column like px.histogram
+            groups, uniques = pd.factorize(data[color], sort=False)
+            names = [str(name) for name in uniques]
+            n_groups = len(names)
+
+    # All traces share the bins so they can be compared when they overlap
+    edges = bin_edges(values if groups is None else values[groups >= 0], nbins)
+    counts = bin_groups(values, edges, groups, n_groups)
+    traces = build_traces(histogram_trace, [(counts[i], edges, name, orientation) for i, name in enumerate(names)])
+    fig = go.Figure(data=traces)
+
+    # Make the histograms visible if they overlap
+    fig.update_layout(barmode='overlay', bargap=0, xaxis_title="Value", yaxis_title="Frequency")
+    if orientation == "h":
+        fig.update_layout(xaxis_title="Frequency", yaxis_title="Value")
+    if len(names) > 1:
+        fig.update_traces(opacity=0.8)
+        fig.update_layout(legend_title_text=color if data_format == "long" else None)
+    else:
+        fig.update_layout(showlegend=False)
+    return fig
+
+
+def histogram_trace(counts, edges, name, orientation='v'):
+    """ Returns a bar trace with the counts of the bins """
+    centers = bin_centers(edges)
+    if orientation == "h":
+        return go.Bar(x=counts, y=centers, width=np.diff(edges), name=name, orientation="h",
+                      hovertemplate="%{y}: %{x}<extra>" + name + "</extra>")
+    return go.Bar(x=centers, y=counts, width=np.diff(edges), name=name,
+                  hovertemplate="%{x}: %{y}<extra>" + name + "</extra>")
 
 
 ################################### SCATTER PLOT ###################################
 
 
-def generate_scatter(data, x, y, data_format="wide", selected_points=[], **kwargs):
-    """ Generates and returns a scatter plot """
+def generate_scatter(data, x, y, data_format="wide", selected_points=[], max_points=None, trendline=None, **kwargs):
+    """ Generates and returns a scatter plot, selected_points holds the row ids of the selected rows
+
+    With max_points larger data is downsampled, keeping the selected points and the outliers.
+    trendline is "ols" or "lowess", the lines are fitted on all the rows.
+    """
     if data_format == "wide":
         fig = go.Figure()
 
@@ -117,21 +137,23 @@ def generate_scatter(data, x, y, data_format="wide", selected_points=[], **kwarg
                 previous = x[0]
 
 
-            """colors = data["value"][data["variable"] == "SARS-Cov-2 exam result"].to_numpy()
+            """colors = data["SARS-Cov-2 exam result"].to_numpy()
             colors = np.where(colors=="positive", "red", colors)
             colors = np.where(colors=="negative", "blue", colors)"""
 
-            # Loop through the pairs of attributes and add traces to the graph
+            # Build a trace for every pair of attributes
             # zip_longest makes sure the number of pairs correspond to the lenght of the lognest of two argumens
             # The shorter argument is paired with the previous argument
-            for attribute_x, attribute_y in zip_longest(x, y, fillvalue=previous):
-                fig.add_trace(go.Scatter(
-                    x=data["value"][data["variable"] == attribute_x],
-                    y=data["value"][data["variable"] == attribute_y],
+            # WebGL keeps large scatter plots responsive
+            trace_type = go.Scattergl if len(data) > WEBGL_THRESHOLD else go.Scatter
+            columns = column_arrays(data, x + y)
+            pairs = list(zip_longest(x, y, fillvalue=previous))
+            fig.add_traces(build_traces(lambda attribute_x, attribute_y: trace_type(
+                    x=columns[attribute_x],
+                    y=columns[attribute_y],
                     name=attribute_x + "-" + attribute_y,
                     mode='markers',
-                    )
-                )
+                    ), pairs))
             fig.update_layout(legend=dict(
                             orientation="h",
                             yanchor="bottom",
@@ -142,38 +164,149 @@ def generate_scatter(data, x, y, data_format="wide", selected_points=[], **kwarg
         return fig
 
     elif data_format == "long":
-        fig = px.scatter(data, x=x, y=y, **kwargs)
+        plot_data = data
+        if max_points and len(data) > max_points:
+            positions = downsample(data[x], data[y], max_points, keep=np.isin(data.index, selected_points))
+            plot_data = data.take(positions)
+
+        # The row ids are attached to the points so selections can be mapped back to the rows
+        render_mode = "webgl" if len(plot_data) > WEBGL_THRESHOLD else "svg"
+        fig = px.scatter(plot_data, x=x, y=y, custom_data=[plot_data.index.to_numpy()], render_mode=render_mode, **kwargs)
+        # The axes still show the range of all the data
+        if plot_data is not data:
+            fig.update_layout(xaxis_range=padded_range(data[x]), yaxis_range=padded_range(data[y]))
+
+        if trendline:
+            add_trendlines(fig, data, x, y, trendline, kwargs.get("color"))
+
         # Highlight the selected point with yellow
-        if selected_points:
-            fig.update_traces(selectedpoints=selected_points, selected={'marker': { 'color': 'yellow' }})
+        if len(selected_points) > 0:
+            highlight_selected(fig, selected_points)
         return fig
 
 
+def add_trendlines(fig, data, x, y, method, color=None):
+    """ Adds the fitted line of every color group as a separate trace """
+    if isinstance(color, str):
+        groups = [(str(name), group) for name, group in data.groupby(color, sort=False)]
+    else:
+        groups = [(None, data)]
+
+    # Draw each line in the color of the markers of its group
+    colors = {trace.name or None: trace.marker.color for trace in fig.data}
+    for name, group in groups:
+        fit = trendline(group[x], group[y], method, fit_key(method, x, y, group.index, name))
+        fig.add_trace(go.Scatter(
+            x=fit["x"],
+            y=fit["y"],
+            mode="lines",
+            name=name,
+            legendgroup=name,
+            showlegend=False,
+            line={"color": colors.get(name)},
+            hovertemplate=fit["label"] + "<extra></extra>"
+            )
+        )
+
+
+def highlight_selected(fig, selected_points):
+    """ Marks the points of the selected rows in every trace of the figure """
+    for trace in fig.data:
+        if trace.customdata is None:
+            continue
+        row_ids = np.asarray(trace.customdata)[:, 0]
+        trace.update(selectedpoints=np.flatnonzero(np.isin(row_ids, selected_points)),
+                     selected={'marker': { 'color': 'yellow' }})
+
+
 ################################### SPLOM ###################################
 
 
-def generate_scatter_matrix(data, x, y, data_format="long", **kwargs):
+def generate_scatter_matrix(data, x, y, data_format="long", selected_points=[], max_points=None, **kwargs):
+    """ Generates and returns a scatter matrix, it is drawn with WebGL and downsampled with max_points """
     if data_format == "long":
         dimensions = x + y
-        fig = px.scatter_matrix(data, dimensions=dimensions, **kwargs)
+        plot_data = data
+        if max_points and len(data) > max_points:
+            # The grid of the downsampling spans the first pair of dimensions
+            positions = downsample(data[dimensions[0]], data[dimensions[1]], max_points,
+                                   keep=np.isin(data.index, selected_points))
+            plot_data = data.take(positions)
+
+        fig = px.scatter_matrix(plot_data, dimensions=dimensions, custom_data=[plot_data.index.to_numpy()], **kwargs)
         fig.update_traces(diagonal_visible=False)
+        # The axes still show the range of all the data, dimension i is drawn on the axes i + 1
+        if plot_data is not data:
+            for i, dimension in enumerate(dimensions):
+                axis_range = {"range": padded_range(data[dimension])}
+                fig.update_layout({"xaxis" + str(i + 1): axis_range, "yaxis" + str(i + 1): axis_range})
         return fig
 
 
 ################################### BOX PLOT ###################################
 
-def generate_box_plot(data, y, data_format="long", **kwargs):
-    if data_format == "long":
-        return px.box(data, y=y, color=data['Cluster'])
+def generate_box_summary(x, summary, selected=None, **kwargs):
+    """ Generates and returns box plots of the groups of a GroupSummary from its statistics, without the rows
+
+    With selected, the statistics of the selected rows are shown next to those of all the rows of each group.
+    """
+    colors = px.colors.qualitative.Plotly
+    shown = [("", summary.box_statistics(), 1.0)]
+    if selected is not None and selected[0].sum() > 0:
+        shown.append((" selected", summary.box_statistics(selected), 0.5))
+
+    fig = go.Figure()
+    for suffix, box, opacity in shown:
+        for group, name in enumerate(summary.groups):
+            # Plotly can't draw the boxes of columns without rows in the group
+            present = np.flatnonzero(box["count"][group] > 0)
+            fig.add_trace(go.Box(
+                x=[x[j] for j in present],
+                q1=box["q1"][group, present],
+                median=box["median"][group, present],
+                q3=box["q3"][group, present],
+                lowerfence=box["lowerfence"][group, present],
+                upperfence=box["upperfence"][group, present],
+                mean=box["mean"][group, present],
+                sd=box["sd"][group, present],
+                boxmean="sd",
+                name=name + suffix,
+                legendgroup=name,
+                marker_color=colors[group % len(colors)],
+                opacity=opacity,
+                ))
+    fig.update_layout(boxmode="group", legend_title_text="Cluster")
+    return fig
 
 
 ################################### HEATMAP ###################################
 
 
-def generate_heatmap(data, x, y, data_format="long", **kwargs):
+def generate_heatmap(data, x, y, z=None, data_format="long", histfunc="count", nbins="auto", **kwargs):
+    """ Generates and returns a heatmap of the rows binned here, histfunc aggregates the Z column in each bin """
     if data_format == "long":
-        # TODO Add aggregation
-        return px.density_heatmap(data, x=x[0], y=y[0])
+        # Without a Z column only the rows can be counted
+        if not z:
+            histfunc = "count"
+        x_values = data[x[0]].to_numpy(dtype=float)
+        y_values = data[y[0]].to_numpy(dtype=float)
+        z_values = data[z[0]].to_numpy(dtype=float) if histfunc != "count" else None
+
+        x_edges = bin_edges(x_values, nbins)
+        y_edges = bin_edges(y_values, nbins)
+        cells = bin_2d(x_values, y_values, x_edges, y_edges, z_values, histfunc)
+        title = "count" if histfunc == "count" else "{} of {}".format(histfunc, z[0])
+
+        fig = go.Figure(go.Heatmap(
+            x=bin_centers(x_edges),
+            y=bin_centers(y_edges),
+            z=cells,
+            colorbar={"title": title},
+            hovertemplate=x[0] + ": %{x}<br>" + y[0] + ": %{y}<br>" + title + ": %{z}<extra></extra>"
+            )
+        )
+        fig.update_layout(xaxis_title=x[0], yaxis_title=y[0])
+        return fig
 
 
 ################################### PARALLEL COORDINATES ##########################
@@ -188,8 +321,12 @@ def generate_parallel_coords(data, x, y, data_format="long", **kwargs):
 
 
 def generate_strip(data, x, y, data_format="long", **kwargs):
+    """ Generates and returns a strip plot, the categories are shown in the order of their codes """
     if data_format == "long":
-        return px.strip(data, x=x[0], y=y[0], **kwargs)
+        columns = [x[0], kwargs.get("color")]
+        category_orders = {column: observed_labels(data[column]) for column in columns
+                           if isinstance(column, str) and is_encoded(data[column])}
+        return px.strip(data, x=x[0], y=y[0], category_orders=category_orders, **kwargs)
 
 
 ################################### TERNARY ##########################
@@ -197,4 +334,43 @@ def generate_strip(data, x, y, data_format="long", **kwargs):
 
 def generate_ternary(data, x, y, z, data_format="long", **kwargs):
     if data_format == "long":
-        return px.scatter_ternary(data, a=x[0], b=y[0], c=z[0], **kwargs)
\ No newline at end of file
+        return px.scatter_ternary(data, a=x[0], b=y[0], c=z[0], **kwargs)
+
+
+################################### CORRELATION OVERVIEW ##########################
+
+
+def generate_correlation(x, matrix, top=15, **kwargs):
+    """ Generates and returns a heatmap of the pairwise correlations next to the strongest pairs
+
+    matrix holds the precomputed statistics of the shown rows, see graph_generation/statistics.py.
+    """
+    if x:
+        matrix = select_columns(matrix, x)
+    columns = matrix["columns"]
+    pairs = ranked_pairs(matrix, top)
+
+    fig = make_subplots(rows=1, cols=2, column_widths=[0.65, 0.35], horizontal_spacing=0.25,
+                        subplot_titles=("Pairwise correlation", "Strongest pairs"))
+    fig.add_trace(go.Heatmap(
+        x=columns,
+        y=columns,
+        z=matrix["corr"],
+        customdata=matrix["counts"],
+        zmin=-1, zmax=1, colorscale="RdBu_r",
+        colorbar={"title": "r", "x": 0.52},
+        hovertemplate="%{x}<br>%{y}<br>r: %{z:.3f}<br>rows: %{customdata}<extra></extra>"
+        ), row=1, col=1)
+    # The strongest pair is shown at the top
+    fig.add_trace(go.Bar(
+        x=[corr for _, _, corr, _ in pairs][::-1],
+        y=["{} / {}".format(first, second) for first, second, _, _ in pairs][::-1],
+        customdata=[rows for _, _, _, rows in pairs][::-1],
+        orientation="h",
+        marker_color=["#b2182b" if corr > 0 else "#2166ac" for _, _, corr, _ in pairs][::-1],
+        hovertemplate="%{y}<br>r: %{x:.3f}<br>rows: %{customdata}<extra></extra>",
+        showlegend=False
+        ), row=1, col=2)
+    fig.update_xaxes(range=[-1, 1], row=1, col=2)
+    fig.update_yaxes(autorange="reversed", row=1, col=1)
+    return fig
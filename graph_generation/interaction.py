@@ -1,35 +1,106 @@
+import threading
 import numpy as np
+from data_processing.catalog import column_kind
+from data_processing.encoding import codes, labels
 
 
-def filter_data(df, value_filter_dropdown, value_filter_slider):
-    """ Filters a dataframe by a value and retunrs it """
-    if value_filter_dropdown != None and df[value_filter_dropdown].dtypes == "float64":
-        data = df[(df[value_filter_dropdown] >= value_filter_slider[0]) & (df[value_filter_dropdown] <= value_filter_slider[1])]
+class FilterIndex:
+    """ Sorted per-column indexes used to filter a shared dataframe without copying or mutating it """
+
+    def __init__(self, df, catalog=None):
+        self.df = df
+        self.catalog = catalog
+        self._columns = dict()
+        self._lock = threading.Lock()
+
+    def positions(self, column, value_range):
+        """ Returns the sorted row positions that pass the filter, or None if the column can't be filtered """
+        found = self.slices(column, value_range)
+        if found is None:
+            return None
+        order, ranges = found
+        positions = np.concatenate([order[start:stop] for start, stop in ranges] or [np.empty(0, dtype=np.intp)])
+
+        # Keep the original row order so the graphs look the same as without the index
+        return np.sort(positions)
+
+    def slices(self, column, value_range):
+        """ Returns the rows sorted by the column and the (start, stop) runs of them that pass the filter
+
+        None is returned if the column can't be filtered.
+        """
+        index = self._column_index(column)
+
+        if index["kind"] == "object":
+            # The slider values are the codes of the categories, each selects a run of the rows sorted by code
+            offsets = index["offsets"]
+            codes = sorted(set(int(value) for value in value_range if 0 <= value < len(offsets) - 1))
+            ranges = [(offsets[code], offsets[code + 1]) for code in codes]
+
+        elif index["kind"] in ("float", "int"):
+            lower = np.searchsorted(index["values"], value_range[0], side="left")
+            upper = np.searchsorted(index["values"], value_range[-1], side="right")
+            ranges = [(lower, upper)]
 
-    elif value_filter_dropdown != None and (df[value_filter_dropdown].dtypes == "object" or df[value_filter_dropdown].dtypes == "int64"):
-        if df[value_filter_dropdown].dtypes == "int64":
-            indices = list(range(value_filter_slider[0], value_filter_slider[-1]+1))
         else:
-            indices = df[value_filter_dropdown].dropna().unique()[list(set(value_filter_slider))]
-        data = df[df[value_filter_dropdown].isin(indices)]
-
-    else:
-        data = df
-    
-    # Reset the indexes to match the point numbers on the graph
-    data.reset_index(drop=True, inplace=True)
-
-    return data
-
-
-def select(df, selectedData, graph_type, x, y):
-    """ Modifies a list of selected points """
-    if selectedData and graph_type == "scatter":
-        for p in selectedData['points']:
-            if df.loc[p['pointIndex'], 'select'] == False:
-                df.loc[(df[x[0]] == p['x']) & (df[y[0]] == p['y']), 'select'] = True
-            else:
-                df.loc[(df[x[0]] == p['x']) & (df[y[0]] == p['y']), 'select'] = False
+            return None
+
+        return index["order"], ranges
+
+    def _column_index(self, column):
+        """ Returns the index of a column, building it on first use """
+        index = self._columns.get(column)
+        if index is None:
+            with self._lock:
+                index = self._columns.get(column)
+                if index is None:
+                    kind = self.catalog[column]["kind"] if self.catalog else None
+                    index = build_column_index(self.df[column], kind)
+                    self._columns[column] = index
+        return index
+
+
+def build_column_index(series, kind=None):
+    """ Builds a sorted index of a column for range and category lookups """
+    if kind is None:
+        kind = column_kind(series)
+
+    if kind in ("float", "int"):
+        values = series.to_numpy()
+        order = np.argsort(values, kind="stable")
+        # NaNs are sorted last and never pass a filter
+        order = order[:series.count()]
+        return {"kind": kind,
+                "order": order,
+                "values": values[order]}
+
+    elif kind == "object":
+        # The same codes as the slider marks, categorical columns already hold them
+        row_codes = codes(series)
+        order = np.argsort(row_codes, kind="stable")
+        # Missing values have the code -1 and are sorted before the first category
+        offsets = np.searchsorted(row_codes[order], np.arange(len(labels(series)) + 1))
+        return {"kind": "object",
+                "order": order,
+                "offsets": offsets}
+
+    return {"kind": None}
+
+
+def filter_data(df, value_filter_dropdown, value_filter_slider, index=None):
+    """ Filters a dataframe by a value and returns it, the input dataframe is never modified """
+    if value_filter_dropdown == None:
+        return df
+
+    if index is None:
+        index = FilterIndex(df)
+
+    positions = index.positions(value_filter_dropdown, value_filter_slider)
+    if positions is None:
+        return df
+
+    # The rows keep their labels, which are the row ids of the shared dataframe
+    return df.take(positions)
 
 
 def flip_axes(flip_value, opts, graph_type, x, y):
@@ -0,0 +1,133 @@
+import base64
+import numpy as np
+import pandas as pd
+from graph_generation.cache import LRUCache
+
+
+# Bins of the quantile sketch of every column, their edges are quantiles of the column so each holds as many rows
+SKETCH_BINS = 256
+# Sessions whose selected statistics are kept per summary
+SESSIONS = 64
+
+
+class GroupSummary:
+    """ Per group counts, sums, sums of squares and quantile sketches of some columns over the rows of a view
+
+    The statistics add up over rows. Those of the selection of a session are kept and updated from the rows that
+    changed since its previous selection, so a new selection costs the changed rows and the groups, not all rows.
+    """
+
+    def __init__(self, data, variables, labels):
+        """ labels are the groups of the rows indexed by row id, rows without one are left out """
+        labels = labels.dropna()
+        self.variables = list(variables)
+        # The groups are in the order they appear in the data, like the colors of the main graph
+        self.codes, self.groups = pd.factorize(labels.astype(str), sort=False)
+        self.rows = labels.index.to_numpy()
+        self.values = data[self.variables].to_numpy(dtype=float)[data.index.get_indexer(labels.index)]
+        self.edges = [sketch_edges(self.values[:, j]) for j in range(len(self.variables))]
+        self.bins = np.column_stack([sketch_bins(self.values[:, j], edges) for j, edges in enumerate(self.edges)])
+        # Row id to the position in the summary, -1 for the rows of other views
+        self._positions = np.full(self.rows.max() + 1 if len(self.rows) else 0, -1, dtype=np.intp)
+        self._positions[self.rows] = np.arange(len(self.rows))
+        self.totals = self.aggregate(np.arange(len(self.rows)))
+        self._selections = LRUCache(max_entries=SESSIONS, max_bytes=64 * 2**20,
+                                    sizeof=lambda entry: entry[0].nbytes + sum(array.nbytes for array in entry[1]))
+
+    @property
+    def nbytes(self):
+        """ Memory of the per row arrays, the statistics are small next to them """
+        return self.values.nbytes + self.bins.nbytes + self._positions.nbytes
+
+    def aggregate(self, positions):
+        """ Returns the sketches, sums and sums of squares per group and column of the rows at positions """
+        n_groups, n_bins = len(self.groups), SKETCH_BINS
+        shape = (n_groups, len(self.variables))
+        sketch, sums, squares = np.zeros(shape + (n_bins,)), np.zeros(shape), np.zeros(shape)
+        codes = self.codes[positions]
+        for j in range(len(self.variables)):
+            bins = self.bins[positions, j]
+            valid = bins >= 0
+            group, values = codes[valid], self.values[positions[valid], j]
+            sketch[:, j] = np.bincount(group * n_bins + bins[valid], minlength=n_groups * n_bins).reshape(n_groups, n_bins)
+            sums[:, j] = np.bincount(group, weights=values, minlength=n_groups)
+            squares[:, j] = np.bincount(group, weights=values * values, minlength=n_groups)
+        return sketch, sums, squares
+
+    def selected(self, session, encoded):
+        """ Returns the statistics of the rows selected in a session, encoded is the bitset of its session state """
+        bits = np.frombuffer(base64.b64decode(encoded), dtype=np.uint8)
+        previous = self._selections.get(session)
+        if previous is None or previous[0].shape != bits.shape:
+            previous = (np.zeros_like(bits), tuple(np.zeros_like(a) for a in self.totals))
+        previous_bits, statistics = previous
+
+        # Only the bytes of the bitset that differ are expanded to rows
+        changed = np.flatnonzero(previous_bits != bits)
+        if len(changed):
+            rows = (changed[:, None] * 8 + np.arange(8)).ravel()
+            before = np.unpackbits(previous_bits[changed]).astype(bool)
+            after = np.unpackbits(bits[changed]).astype(bool)
+            added = self._lookup(rows[after & ~before])
+            removed = self._lookup(rows[before & ~after])
+            statistics = tuple(total + plus - minus for total, plus, minus
+                               in zip(statistics, self.aggregate(added), self.aggregate(removed)))
+        self._selections.put(session, (bits.copy(), statistics))
+        return statistics
+
+    def _lookup(self, rows):
+        """ Returns the positions of the rows that are part of the summary """
+        rows = rows[rows < len(self._positions)]
+        positions = self._positions[rows]
+        return positions[positions >= 0]
+
+    def box_statistics(self, statistics=None):
+        """ Returns the count, mean, standard deviation, quartiles and whisker ends per group and column """
+        sketch, sums, squares = self.totals if statistics is None else statistics
+        counts = sketch.sum(axis=2)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            mean = sums / counts
+            sd = np.sqrt(np.maximum(squares - sums * mean, 0) / (counts - 1))
+        box = {"count": counts, "mean": mean, "sd": sd}
+        for name in ("lowest", "q1", "median", "q3", "highest"):
+            box[name] = np.full(counts.shape, np.nan)
+
+        for (group, j), count in np.ndenumerate(counts):
+            if count == 0:
+                continue
+            edges, cumulative = self.edges[j], np.cumsum(sketch[group, j])
+            occupied = np.flatnonzero(sketch[group, j])
+            box["lowest"][group, j], box["highest"][group, j] = edges[occupied[0]], edges[occupied[-1] + 1]
+            for name, q in (("q1", 0.25), ("median", 0.5), ("q3", 0.75)):
+                box[name][group, j] = sketch_quantile(sketch[group, j], cumulative, edges, q)
+
+        # The whiskers end at the furthest values within 1.5 interquartile ranges, like plotly computes them
+        spread = 1.5 * (box["q3"] - box["q1"])
+        box["lowerfence"] = np.fmax(box["lowest"], box["q1"] - spread)
+        box["upperfence"] = np.fmin(box["highest"], box["q3"] + spread)
+        return box
+
+
+def sketch_edges(values):
+    """ Returns the bin edges of a column's sketch, at its quantiles so dense ranges get narrow bins """
+    values = values[np.isfinite(values)]
+    if len(values) == 0:
+        return np.array([0.0, 1.0])
+    edges = np.unique(np.quantile(values, np.linspace(0, 1, SKETCH_BINS + 1)))
+    return edges if len(edges) > 1 else np.array([edges[0], edges[0] + 1.0])
+
+
+def sketch_bins(values, edges):
+    """ Returns the sketch bin of every value, -1 for missing values """
+    bins = np.clip(np.searchsorted(edges, values, side="right") - 1, 0, len(edges) - 2)
+    bins[~np.isfinite(values)] = -1
+    return bins
+
+
+def sketch_quantile(counts, cumulative, edges, q):
+    """ Returns the q quantile of a sketch, interpolated linearly inside its bin """
+    target = q * cumulative[-1]
+    k = min(int(np.searchsorted(cumulative, target, side="left")), len(counts) - 1)
+    below = cumulative[k] - counts[k]
+    fraction = (target - below) / counts[k] if counts[k] else 0.0
+    return edges[k] + fraction * (edges[k + 1] - edges[k])
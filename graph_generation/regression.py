@@ -0,0 +1,111 @@
+import numpy as np
+from graph_generation.cache import LRUCache, rows_fingerprint
+
+
+# Number of points the LOWESS curve is evaluated at
+LOWESS_POINTS = 200
+# LOWESS is fitted on an evenly spaced sample of at most this many points
+LOWESS_MAX_SAMPLE = 5000
+
+# Fitted lines keyed by method, variables, group and the fitted rows
+fits = LRUCache(max_entries=256, max_bytes=32 * 2**20, sizeof=lambda fit: fit["x"].nbytes + fit["y"].nbytes)
+
+
+def trendline(x, y, method="ols", key=None):
+    """ Fits a trendline and returns the points of the line, cached under key when it is given """
+    if key is not None:
+        fit = fits.get(key)
+        if fit is not None:
+            return fit
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    valid = np.isfinite(x) & np.isfinite(y)
+    x, y = x[valid], y[valid]
+
+    if method == "ols":
+        fit = ols_fit(x, y)
+    elif method == "lowess":
+        fit = lowess_fit(x, y)
+    else:
+        raise ValueError("Unknown trendline method: {}".format(method))
+
+    if key is not None:
+        fits.put(key, fit)
+    return fit
+
+
+def fit_key(method, x_name, y_name, index, group=None):
+    """ Returns the cache key of the fit of the rows in index """
+    return (method, x_name, y_name, str(group), rows_fingerprint(index))
+
+
+def ols_fit(x, y):
+    """ Fits a least-squares line in closed form """
+    if len(x) < 2 or np.ptp(x) == 0:
+        return {"x": np.empty(0), "y": np.empty(0), "label": "OLS trendline"}
+
+    x_mean, y_mean = x.mean(), y.mean()
+    dx, dy = x - x_mean, y - y_mean
+    slope = (dx * dy).sum() / (dx * dx).sum()
+    intercept = y_mean - slope * x_mean
+    total = (dy * dy).sum()
+    r2 = 1 - ((dy - slope * dx)**2).sum() / total if total > 0 else 1.0
+
+    ends = np.array([x.min(), x.max()])
+    label = "OLS trendline<br>y = {:.4g} * x + {:.4g}<br>R<sup>2</sup>={:.4f}".format(slope, intercept, r2)
+    return {"x": ends, "y": intercept + slope * ends, "label": label}
+
+
+def lowess_fit(x, y, frac=2/3, iterations=3, n_points=LOWESS_POINTS, max_sample=LOWESS_MAX_SAMPLE):
+    """ Fits a locally weighted linear regression with tricube weights and robustifying iterations
+
+    The curve is evaluated at up to n_points quantiles of x instead of at every point, and larger data
+    is reduced to max_sample points evenly spaced along x first.
+    """
+    if len(x) < 3:
+        return {"x": np.empty(0), "y": np.empty(0), "label": "LOWESS trendline"}
+
+    order = np.argsort(x, kind="stable")
+    if len(order) > max_sample:
+        order = order[np.linspace(0, len(order) - 1, max_sample).round().astype(int)]
+    x, y = x[order], y[order]
+    n = len(x)
+    grid = np.unique(np.quantile(x, np.linspace(0, 1, min(n_points, n))))
+    k = min(max(int(np.ceil(frac * n)), 2), n)
+
+    robustness = np.ones(n)
+    for iteration in range(iterations + 1):
+        fitted = local_linear(x, y, grid, k, robustness)
+        if iteration == iterations:
+            break
+        # Downweight the points with large residuals (bisquare weights)
+        residuals = y - np.interp(x, grid, fitted)
+        scale = 6 * np.median(np.abs(residuals))
+        if scale == 0:
+            break
+        robustness = np.clip(1 - (residuals / scale)**2, 0, None)**2
+
+    return {"x": grid, "y": fitted, "label": "LOWESS trendline"}
+
+
+def local_linear(x, y, grid, k, robustness):
+    """ Evaluates a weighted linear fit of the k nearest points at every grid point """
+    fitted = np.empty(len(grid))
+    for i, x0 in enumerate(grid):
+        distances = np.abs(x - x0)
+        bandwidth = np.partition(distances, k - 1)[k - 1]
+        if bandwidth == 0:
+            bandwidth = distances.max() or 1
+        weights = np.clip(1 - (distances / bandwidth)**3, 0, None)**3 * robustness
+
+        total = weights.sum()
+        if total == 0:
+            fitted[i] = np.nan
+            continue
+        x_mean = (weights * x).sum() / total
+        y_mean = (weights * y).sum() / total
+        variance = (weights * (x - x_mean)**2).sum()
+        slope = (weights * (x - x_mean) * (y - y_mean)).sum() / variance if variance > 0 else 0
+        fitted[i] = y_mean + slope * (x0 - x_mean)
+    return fitted
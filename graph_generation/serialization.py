@@ -0,0 +1,89 @@
+import base64
+import json
+import os
+import numpy as np
+from plotly.utils import PlotlyJSONEncoder
+
+# orjson is much faster than the json module, it is used when it is installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# Numeric arrays of the traces with at least this many values are sent as base64 typed arrays
+TYPED_ARRAY_MIN = 64
+# The typed array types of the numpy kinds, the browser decodes them in assets/callbacks.js
+TYPED_ARRAY_TYPES = {"f": "<f4", "i": "<i4", "u": "<u4", "b": "|u1"}
+# Encodes the values orjson doesn't know, e.g. timestamps, like Dash would
+ENCODER = PlotlyJSONEncoder()
+
+
+def encode_figure(fig, typed_arrays=None):
+    """ Returns the JSON of a figure as bytes, with the numeric arrays of its traces as typed arrays
+
+    A typed array is {"dtype": "f4", "bdata": <base64>, "shape": "rows, columns"} like plotly.js 2 reads them,
+    the floats are sent in single precision.
+    """
+    return dumps(figure_json(fig, typed_arrays))
+
+
+def figure_json(fig, typed_arrays=None):
+    """ Returns the dictionary encode_figure() writes as JSON """
+    if typed_arrays is None:
+        typed_arrays = typed_arrays_enabled()
+    figure = fig.to_plotly_json()
+    if typed_arrays:
+        figure["data"] = [encode_arrays(trace) for trace in figure["data"]]
+    return figure
+
+
+def encode_arrays(value):
+    """ Replaces the numeric arrays in a trace, or in the dictionaries and lists it holds, by typed arrays """
+    if isinstance(value, dict):
+        return {key: encode_arrays(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)) and any(isinstance(item, dict) for item in value):
+        return [encode_arrays(item) for item in value]
+    if isinstance(value, np.ndarray) and value.dtype.kind in TYPED_ARRAY_TYPES and value.size >= TYPED_ARRAY_MIN:
+        return typed_array(value)
+    if isinstance(value, np.ndarray) and value.dtype.kind == "O":
+        # e.g. the categories of a strip plot, orjson only encodes numeric arrays
+        return value.tolist()
+    return value
+
+
+def typed_array(values):
+    """ Encodes a numeric array as a base64 typed array """
+    dtype = np.dtype(TYPED_ARRAY_TYPES[values.dtype.kind])
+    # Integers that don't fit in 32 bits are sent as doubles
+    if values.dtype.kind in "iu" and values.size and \
+            (values.min() < np.iinfo(dtype).min or values.max() > np.iinfo(dtype).max):
+        dtype = np.dtype("<f8")
+    encoded = {"dtype": dtype.str[1:], "bdata": base64.b64encode(np.ascontiguousarray(values, dtype=dtype)).decode("ascii")}
+    if values.ndim > 1:
+        encoded["shape"] = ", ".join(str(length) for length in values.shape)
+    return encoded
+
+
+def dumps(value):
+    """ Returns the JSON of a value as bytes, with orjson if it can encode all the values """
+    encoded = fast_dumps(value)
+    if encoded is None:
+        encoded = json.dumps(value, cls=PlotlyJSONEncoder).encode("utf-8")
+    return encoded
+
+
+def fast_dumps(value):
+    """ Returns the JSON of a value written by orjson, None if orjson isn't installed or can't encode a value """
+    if orjson is None:
+        return None
+    try:
+        return orjson.dumps(value, option=orjson.OPT_SERIALIZE_NUMPY, default=ENCODER.default)
+    except TypeError:
+        # Values that neither orjson nor plotly can encode
+        return None
+
+
+def typed_arrays_enabled():
+    """ Typed arrays are used unless CLINVIS_TYPED_ARRAYS is 0 """
+    return os.environ.get("CLINVIS_TYPED_ARRAYS", "1") != "0"
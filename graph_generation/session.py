@@ -0,0 +1,38 @@
+import base64
+import hashlib
+import uuid
+import numpy as np
+
+
+def new_state(n_rows):
+    """ Returns the state of a new session: a random id and nothing selected
+
+    The browser toggles the selection with the same encoding, see assets/callbacks.js.
+    """
+    return {"id": uuid.uuid4().hex, "rows": n_rows, "selection": encode_mask(np.zeros(n_rows, dtype=bool))}
+
+
+def encode_mask(mask):
+    """ Encodes a boolean row mask as a base64 bitset """
+    return base64.b64encode(np.packbits(mask).tobytes()).decode("ascii")
+
+
+def decode_mask(encoded, n_rows):
+    """ Decodes a base64 bitset into a boolean row mask """
+    bits = np.frombuffer(base64.b64decode(encoded), dtype=np.uint8)
+    return np.unpackbits(bits, count=n_rows).astype(bool)
+
+
+def get_selection(state, n_rows):
+    """ Returns the selection mask of a session """
+    # A state from another version of the dataset can't be mapped to its rows
+    if not state or state.get("rows") != n_rows:
+        return np.zeros(n_rows, dtype=bool)
+    return decode_mask(state["selection"], n_rows)
+
+
+def selection_version(state):
+    """ Returns a short fingerprint of the selection of a session """
+    if not state:
+        return None
+    return hashlib.sha1(state["selection"].encode("ascii")).hexdigest()[:16]
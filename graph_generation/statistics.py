@@ -0,0 +1,119 @@
+import threading
+import numpy as np
+from graph_generation.cache import LRUCache
+
+
+# The sorted rows of a filter column are split in this many buckets, the sums of each are kept
+BUCKETS = 64
+# The totals are summed over blocks of rows to bound the memory of the float copy
+CHUNK_ROWS = 65536
+# Pairs with fewer complete rows are not ranked, their correlation is mostly noise
+MIN_PAIR_ROWS = 10
+
+
+class PairwiseStatistics:
+    """ Pairwise-complete correlations and covariances of the float columns of a shared dataframe
+
+    The sums they are computed from add up over rows, so they are kept for the whole data and, per filter column,
+    as prefix sums over buckets of its sorted rows. A filter then only sums the rows of the partial buckets at its ends.
+    """
+
+    def __init__(self, df, columns, index, catalog=None):
+        self.columns = list(columns)
+        self.index = index
+        self._arrays = [df[column].to_numpy() for column in self.columns]
+        # The values are shifted by their medians, it keeps the sums of squares small and the results precise
+        medians = [catalog[column]["quantiles"][2] if catalog and catalog[column].get("quantiles") else 0.0
+                   for column in self.columns]
+        self.shifts = np.nan_to_num(np.asarray(medians, dtype=float))
+        self.totals = sum((self._sums(slice(start, start + CHUNK_ROWS)) for start in range(0, len(df), CHUNK_ROWS)),
+                          np.zeros((4, len(self.columns), len(self.columns))))
+        self._prefixes = LRUCache(max_entries=64, max_bytes=128 * 2**20, sizeof=lambda prefix: prefix[1].nbytes)
+        self._lock = threading.Lock()
+
+    def matrix(self, filter_column=None, value_range=None):
+        """ Returns the statistics of the rows that pass the filter, of all rows without one """
+        found = self.index.slices(filter_column, value_range) if filter_column is not None else None
+        if found is None:
+            return pairwise_matrix(self.columns, self.totals)
+
+        order, ranges = found
+        sums = np.zeros_like(self.totals)
+        for start, stop in ranges:
+            sums += self._range_sums(filter_column, order, start, stop)
+        return pairwise_matrix(self.columns, sums)
+
+    def _range_sums(self, column, order, start, stop):
+        """ Returns the sums of the rows order[start:stop], from the prefix sums and the rows of the partial buckets """
+        size, prefix = self._prefix(column, order)
+        first, last = -(-start // size), stop // size
+        if first >= last:
+            return self._sums(order[start:stop])
+        return (prefix[last] - prefix[first]
+                + self._sums(order[start:first * size]) + self._sums(order[last * size:stop]))
+
+    def _prefix(self, column, order):
+        """ Returns the bucket size and the prefix sums over the buckets of a filter column, built on first use """
+        prefix = self._prefixes.get(column)
+        if prefix is None:
+            with self._lock:
+                prefix = self._prefixes.get(column)
+                if prefix is None:
+                    size = max(-(-len(order) // BUCKETS), 1)
+                    buckets = [self._sums(order[start:start + size]) for start in range(0, len(order), size)]
+                    sums = np.cumsum([np.zeros_like(self.totals)] + buckets, axis=0)
+                    prefix = (size, sums)
+                    self._prefixes.put(column, prefix)
+        return prefix
+
+    def _sums(self, rows):
+        """ Returns the sufficient statistics of the rows, selected by a slice or by positions """
+        values = np.column_stack([array[rows] for array in self._arrays]).astype(float)
+        return sufficient_statistics(values - self.shifts)
+
+
+def sufficient_statistics(values):
+    """ Returns the sums over the complete rows of every pair of columns
+
+    The four matrices are the counts, the sums of the first column, its sums of squares and the cross products.
+    """
+    present = np.isfinite(values)
+    mask = present.astype(float)
+    values = np.where(present, values, 0.0)
+    return np.stack([mask.T @ mask, values.T @ mask, (values * values).T @ mask, values.T @ values])
+
+
+def pairwise_matrix(columns, sums):
+    """ Returns the counts, covariances and correlations of every pair of columns from their sufficient statistics """
+    counts, totals, squares, products = sums
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # Row i and column j are the sums of column i over the rows where both are present
+        means = totals / counts
+        centered = products - totals * means.T
+        spread = squares - totals * means
+        cov = centered / (counts - 1)
+        corr = centered / np.sqrt(spread * spread.T)
+    cov[counts < 2] = np.nan
+    corr[(counts < 2) | ~np.isfinite(corr)] = np.nan
+    # Rounding can push perfectly correlated columns a bit over one
+    corr = np.clip(corr, -1.0, 1.0)
+    return {"columns": list(columns), "counts": counts.astype(np.int64), "cov": cov, "corr": corr}
+
+
+def select_columns(matrix, columns):
+    """ Returns the statistics of a subset of the columns, in the given order """
+    positions = [matrix["columns"].index(column) for column in columns]
+    grid = np.ix_(positions, positions)
+    return {"columns": list(columns), "counts": matrix["counts"][grid], "cov": matrix["cov"][grid],
+            "corr": matrix["corr"][grid]}
+
+
+def ranked_pairs(matrix, top=20, min_rows=MIN_PAIR_ROWS):
+    """ Returns the pairs of columns with the strongest correlations as (column, column, correlation, rows) """
+    first, second = np.triu_indices(len(matrix["columns"]), k=1)
+    corr = matrix["corr"][first, second]
+    counts = matrix["counts"][first, second]
+    valid = np.flatnonzero(np.isfinite(corr) & (counts >= min_rows))
+    strongest = valid[np.argsort(-np.abs(corr[valid]), kind="stable")[:top]]
+    return [(matrix["columns"][first[i]], matrix["columns"][second[i]], float(corr[i]), int(counts[i]))
+            for i in strongest]
@@ -0,0 +1,35 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+# From this number of traces they are built on a thread pool
+PARALLEL_TRACES = 8
+TRACE_WORKERS = min(4, os.cpu_count() or 1)
+
+_executor = None
+_lock = threading.Lock()
+
+
+def executor():
+    """ Returns the thread pool shared by all requests, it is started on first use """
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=TRACE_WORKERS, thread_name_prefix="traces")
+    return _executor
+
+
+def build_traces(build, arguments, parallel=PARALLEL_TRACES):
+    """ Returns build(*args) for every args in arguments, in order, on the thread pool if there are many """
+    if len(arguments) < parallel or TRACE_WORKERS < 2:
+        return [build(*args) for args in arguments]
+    return list(executor().map(lambda args: build(*args), arguments))
+
+
+def column_arrays(data, columns, dtype=None):
+    """ Reads the columns into one array at once and returns a dictionary of a view per column """
+    columns = list(dict.fromkeys(columns))
+    values = data[columns].to_numpy(dtype=dtype)
+    return {column: values[:, i] for i, column in enumerate(columns)}
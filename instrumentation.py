@@ -0,0 +1,182 @@
+import contextlib
+import functools
+import os
+import threading
+import time
+import flask
+from dash.dependencies import Input, Output
+
+
+# Upper bounds of the histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SIZE_BUCKETS = tuple(1024 * 4**i for i in range(10))
+# The path of the requests that run the callbacks
+DISPATCH_PATH = "_dash-update-component"
+
+
+class Histogram:
+    """ A thread-safe histogram of observed values per label set, in the Prometheus text format """
+
+    def __init__(self, name, description, label_names, buckets):
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = dict()
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = {"counts": [0] * (len(self.buckets) + 1), "sum": 0.0, "count": 0}
+            # The last count is for the values above the largest bucket
+            position = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+            series["counts"][position] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def snapshot(self):
+        """ Returns a copy of the counts, sums and totals of every label set """
+        with self._lock:
+            return {labels: dict(series, counts=list(series["counts"])) for labels, series in self._series.items()}
+
+    def render(self):
+        lines = ["# HELP {} {}".format(self.name, self.description),
+                 "# TYPE {} histogram".format(self.name)]
+        for labels, series in sorted(self.snapshot().items()):
+            label_text = ",".join('{}="{}"'.format(name, value) for name, value in zip(self.label_names, labels))
+            # The bucket counts of the Prometheus format are cumulative
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series["counts"]):
+                cumulative += count
+                lines.append('{}_bucket{{{},le="{}"}} {}'.format(self.name, label_text, bound, cumulative))
+            lines.append("{}_sum{{{}}} {}".format(self.name, label_text, series["sum"]))
+            lines.append("{}_count{{{}}} {}".format(self.name, label_text, series["count"]))
+        return "\n".join(lines)
+
+
+def quantile(series, buckets, q):
+    """ Estimates a quantile from the bucket counts, as the upper bound of the bucket it falls in """
+    rank = q * series["count"]
+    cumulative = 0
+    for bound, count in zip(buckets + (float("inf"),), series["counts"]):
+        cumulative += count
+        if cumulative >= rank:
+            return bound
+    return float("inf")
+
+
+class Instrumentation:
+    """ Records the latency, phases and response size of every Dash callback
+
+    instrument() has to be called before the callbacks are registered.
+    """
+
+    def __init__(self):
+        self.callback_seconds = Histogram("clinvis_callback_seconds", "Wall time of the callback functions",
+                                          ("callback",), LATENCY_BUCKETS)
+        self.phase_seconds = Histogram("clinvis_callback_phase_seconds", "Wall time of the phases of a callback",
+                                       ("callback", "phase"), LATENCY_BUCKETS)
+        self.request_seconds = Histogram("clinvis_request_seconds",
+                                         "Wall time of the callback requests, including the serialization by Dash",
+                                         ("callback",), LATENCY_BUCKETS)
+        self.response_bytes = Histogram("clinvis_response_bytes", "Size of the callback responses",
+                                        ("callback",), SIZE_BUCKETS)
+        self.histograms = (self.callback_seconds, self.phase_seconds, self.request_seconds, self.response_bytes)
+
+    def instrument(self, app, panel=False):
+        """ Times every callback registered on the app from now on and serves the metrics on /metrics
+
+        With panel the debug panel of the layout is refreshed with the summary, its own requests are not recorded.
+        """
+        register = app.callback
+        if panel:
+            register(Output("metrics_panel", "children"),
+                     Input("metrics_interval", "n_intervals"))(lambda n_intervals: self.summary())
+
+        def callback(*args, **kwargs):
+            decorator = register(*args, **kwargs)
+            return lambda function: decorator(self.timed(function))
+
+        app.callback = callback
+        app.server.before_request(self._start_request)
+        app.server.after_request(self._finish_request)
+        app.server.add_url_rule("/metrics", "metrics", self.metrics_response)
+
+    def timed(self, function):
+        """ Wraps a callback function to record its wall time """
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if flask.has_request_context():
+                flask.g.callback_name = function.__name__
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                self.callback_seconds.observe((function.__name__,), elapsed)
+                if flask.has_request_context():
+                    flask.g.callback_seconds = elapsed
+        return wrapper
+
+    @contextlib.contextmanager
+    def phase(self, name, callback=None):
+        """ Records the wall time of a phase of the running callback, e.g. with metrics.phase("figure"):
+
+        Work done outside of the request, e.g. on a background thread, is recorded under the given callback name.
+        """
+        if callback is None:
+            callback = flask.g.get("callback_name", "unknown") if flask.has_request_context() else "unknown"
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phase_seconds.observe((callback, name), time.perf_counter() - start)
+
+    def _start_request(self):
+        if flask.request.path.endswith(DISPATCH_PATH):
+            flask.g.request_started = time.perf_counter()
+
+    def _finish_request(self, response):
+        callback = flask.g.get("callback_name")
+        if callback is not None and "request_started" in flask.g:
+            elapsed = time.perf_counter() - flask.g.request_started
+            self.request_seconds.observe((callback,), elapsed)
+            # Dash serializes the outputs after the callback returned
+            self.phase_seconds.observe((callback, "response"), max(elapsed - flask.g.get("callback_seconds", 0), 0))
+            if not response.direct_passthrough:
+                self.response_bytes.observe((callback,), len(response.get_data()))
+        return response
+
+    def render(self):
+        """ Returns all the histograms in the Prometheus text format """
+        return "\n".join(histogram.render() for histogram in self.histograms) + "\n"
+
+    def metrics_response(self):
+        return flask.Response(self.render(), mimetype="text/plain; version=0.0.4")
+
+    def summary(self):
+        """ Returns a table of the calls, latency and response size of every callback as text """
+        lines = ["{:<28} {:>7} {:>9} {:>9} {:>9} {:>10}".format(
+            "callback", "calls", "mean ms", "p50 ms", "p95 ms", "mean kB")]
+        sizes = self.response_bytes.snapshot()
+        for (callback,), series in sorted(self.request_seconds.snapshot().items()):
+            size = sizes.get((callback,))
+            lines.append("{:<28} {:>7} {:>9.1f} {:>9.0f} {:>9.0f} {:>10.1f}".format(
+                callback, series["count"], series["sum"] / series["count"] * 1000,
+                quantile(series, LATENCY_BUCKETS, 0.5) * 1000, quantile(series, LATENCY_BUCKETS, 0.95) * 1000,
+                size["sum"] / size["count"] / 1024 if size else 0))
+
+        phases = self.phase_seconds.snapshot()
+        if phases:
+            lines += ["", "{:<28} {:<14} {:>7} {:>9}".format("callback", "phase", "calls", "mean ms")]
+            for (callback, phase), series in sorted(phases.items()):
+                lines.append("{:<28} {:<14} {:>7} {:>9.1f}".format(
+                    callback, phase, series["count"], series["sum"] / series["count"] * 1000))
+        return "\n".join(lines)
+
+
+def panel_enabled():
+    """ The debug panel with the callback metrics is shown if CLINVIS_METRICS_PANEL is set """
+    return bool(os.environ.get("CLINVIS_METRICS_PANEL"))
@@ -0,0 +1,119 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+
+# Threads that build the expensive figures, apart from the threads that serve the requests
+JOB_WORKERS = int(os.environ.get("CLINVIS_JOB_WORKERS", 2))
+# Finished jobs are kept this long for the sessions that poll for them
+KEEP_SECONDS = 60
+
+
+class Cancelled(Exception):
+    """ Raised inside a job when no session waits for its result anymore """
+
+
+class Job:
+    """ The build of one view, shared by all the sessions that asked for it """
+
+    def __init__(self, key):
+        self.key = key
+        self.sessions = set()
+        self.progress = 0.0
+        self.message = "Waiting for a free worker"
+        self.future = None
+        self.finished = None
+
+    def report(self, progress, message):
+        """ Records the progress of the job, raises Cancelled if its result is no longer wanted """
+        if not self.sessions:
+            raise Cancelled()
+        self.progress = progress
+        self.message = message
+
+    def cancelled(self):
+        """ Returns True if the job was cancelled before or while it ran """
+        if not self.future.done():
+            return False
+        return self.future.cancelled() or isinstance(self.future.exception(), Cancelled)
+
+
+class JobManager:
+    """ Runs expensive figure builds on a thread pool, one job per view and only the latest one per session
+
+    A session that asks for another view stops waiting for its previous job, which is cancelled once no session
+    waits for it: a queued job never starts and a running one stops at its next report().
+    """
+
+    def __init__(self, workers=JOB_WORKERS):
+        self.workers = workers
+        self._executor = None
+        self._jobs = dict()
+        self._latest = dict()
+        self._lock = threading.Lock()
+
+    def submit(self, session, key, build):
+        """ Returns the job of the view key for the session, build(job) is started unless the view is being built """
+        with self._lock:
+            self._expire()
+            job = self._jobs.get(key)
+            # A job that failed is kept too, the sessions polling for it get its error instead of a retry every time
+            if job is not None and not job.cancelled():
+                self._follow(session, job)
+                return job
+
+            job = Job(key)
+            # The session waits for the job before it starts, or its first report() would cancel it
+            self._follow(session, job)
+            job.future = self.executor().submit(self._run, job, build)
+            self._jobs[key] = job
+            return job
+
+    def release(self, session):
+        """ Stops waiting for the job of the session, e.g. when its new view was built without one """
+        with self._lock:
+            self._follow(session, None)
+
+    def wait(self, job, timeout):
+        """ Returns True if the job is done within timeout seconds """
+        return bool(wait([job.future], timeout).done)
+
+    def executor(self):
+        """ Returns the thread pool of the jobs, it is started on the first submit() """
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="jobs")
+        return self._executor
+
+    def _run(self, job, build):
+        try:
+            job.report(0.0, "Started")
+            return build(job)
+        finally:
+            job.finished = time.monotonic()
+
+    def _follow(self, session, job):
+        """ Makes job the latest job of the session and cancels the previous one if nobody else waits for it """
+        previous = self._latest.pop(session, None)
+        if previous is not None and previous is not job:
+            previous.sessions.discard(session)
+            if not previous.sessions:
+                previous.future.cancel()
+        if job is not None:
+            job.sessions.add(session)
+            self._latest[session] = job
+
+    def _expire(self):
+        """ Forgets the jobs that finished a while ago and the sessions that waited for them """
+        now = time.monotonic()
+        for key, job in list(self._jobs.items()):
+            finished = now - KEEP_SECONDS if job.future.cancelled() else job.finished
+            if finished is not None and now - finished >= KEEP_SECONDS:
+                del self._jobs[key]
+                for session in job.sessions:
+                    self._latest.pop(session, None)
+
+
+def background_enabled():
+    """ Expensive figures are built in the background unless CLINVIS_BACKGROUND is 0 """
+    return os.environ.get("CLINVIS_BACKGROUND", "1") != "0"
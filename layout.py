@@ -1,8 +1,9 @@
 import dash_core_components as dcc
 import dash_html_components as html
+from graph_generation.session import new_state
 
 
-def generate_layout(df, app):
+def generate_layout(df, app, metrics_panel=False):
     layout = html.Div(id="main", children=[
                 html.Div(id="head", children=[
                     html.Div(id="logo", children=[
@@ -34,7 +35,21 @@ def generate_layout(df, app):
                 html.Div(id='main_panel', children=[
                     dcc.Graph(id='main-graph', config={'displayModeBar': False}),
                     dcc.Graph(id='second-graph', config={'displayModeBar': False}),
-                    ]),
+                    # Progress of a figure built in the background, the interval polls for it while it runs
+                    html.Div(id='job_status'),
+                    dcc.Interval(id='job_interval', interval=500, disabled=True),
+                    # Selection (a bitset of row ids) of the user, kept in the browser of each user
+                    dcc.Store(id='session_state', data=new_state(len(df))),
+                    # The figure built by the server, shown with the selection of the session_state
+                    dcc.Store(id='main_figure'),
+                    # The clustered view the second graph summarizes and the selection it shows
+                    dcc.Store(id='linked_view'),
+                    dcc.Store(id='linked_selection'),
+                    ] + ([
+                    # Latency of the callbacks of this worker, refreshed every few seconds
+                    html.Pre(id='metrics_panel'),
+                    dcc.Interval(id='metrics_interval', interval=5000),
+                    ] if metrics_panel else [])),
 
                 # Side panel container
                 html.Div(id='side_panel', children=[
@@ -46,7 +61,8 @@ def generate_layout(df, app):
                                 {'label': 'Heatmap', 'value': 'heatmap'},
                                 {'label': 'Parallel Coords', 'value': 'par_coords'},
                                 {'label': 'Strip', 'value': 'strip'},
-                                {'label': 'Ternary', 'value': 'ternary'}],
+                                {'label': 'Ternary', 'value': 'ternary'},
+                                {'label': 'Correlations', 'value': 'correlation'}],
                         value='scatter',
                         ),
                     html.Label("Options", id="label_options"),
@@ -71,7 +87,7 @@ def generate_layout(df, app):
                     ]),
                     html.Label("Clustering", id="cluster_label"),
                     html.Div(id="cluster_dropdown_container", children=[
-                        dcc.Dropdown(id="cluster_dropdown", value=None)
+                        dcc.Dropdown(id="cluster_dropdown", value=None, multi=True)
                     ]),
                     html.Div(id='input_cluster_container', children=[
                         dcc.Input(id="input_cluster", type="number", placeholder="n", min=1)
@@ -0,0 +1,99 @@
+import builtins
+import importlib
+import os
+import sys
+import threading
+import time
+
+
+# Modules that are only loaded when a feature needs them, CLINVIS_PRELOAD=1 imports them at startup
+# instead, e.g. with gunicorn --preload so the workers share them
+HEAVY_MODULES = ("sklearn.cluster", "openpyxl")
+
+
+class StartupProfiler:
+    """ Records how long the top-level imports take and the time until the first response
+
+    Top-level imports are those made outside of the import of another module, e.g. by app.py. The imports they
+    make in turn are part of their total time, not of their self time.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.imports = dict()
+        self.first_response = None
+        self._original_import = builtins.__import__
+        self._original_import_module = importlib.import_module
+        self._thread = threading.get_ident()
+        self._stack = []
+
+    def start(self):
+        builtins.__import__ = self._import
+        importlib.import_module = self._import_module
+
+    def stop(self):
+        builtins.__import__ = self._original_import
+        importlib.import_module = self._original_import_module
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        # Only the first import of a module in the starting thread does any work worth timing
+        if level != 0 or name in sys.modules or threading.get_ident() != self._thread:
+            return self._original_import(name, globals, locals, fromlist, level)
+        return self._timed(name, self._original_import, name, globals, locals, fromlist, level)
+
+    def _import_module(self, name, package=None):
+        # e.g. preload_heavy_modules() and the lazy submodules of plotly, they don't go through __import__
+        if name.startswith(".") or name in sys.modules or threading.get_ident() != self._thread:
+            return self._original_import_module(name, package)
+        return self._timed(name, self._original_import_module, name, package)
+
+    def _timed(self, name, load, *args):
+        self._stack.append(0.0)
+        start = time.perf_counter()
+        try:
+            return load(*args)
+        finally:
+            elapsed = time.perf_counter() - start
+            children = self._stack.pop()
+            if self._stack:
+                self._stack[-1] += elapsed
+            else:
+                # Cumulative time and the time spent in the module itself, without its imports
+                self.imports.setdefault(name, (elapsed, elapsed - children))
+
+    def attach(self, server):
+        """ Reports the profile once the Flask server sent its first response """
+        @server.after_request
+        def record_first_response(response):
+            if self.first_response is None:
+                self.first_response = time.perf_counter() - self.started
+                self.stop()
+                print(self.report(), file=sys.stderr)
+            return response
+
+    def report(self, top=20):
+        """ Returns the slowest top-level imports and the startup times as text """
+        lines = ["Startup profile",
+                 "{:>10} {:>10}  module".format("total ms", "self ms")]
+        slowest = sorted(self.imports.items(), key=lambda item: item[1][0], reverse=True)[:top]
+        for name, (total, own) in slowest:
+            lines.append("{:>10.1f} {:>10.1f}  {}".format(total * 1000, own * 1000, name))
+        if self.first_response is not None:
+            lines.append("Time to first response: {:.1f} ms".format(self.first_response * 1000))
+        return "\n".join(lines)
+
+
+def start_profiler():
+    """ Starts the startup profiler if CLINVIS_PROFILE_STARTUP is set, returns it or None """
+    if not os.environ.get("CLINVIS_PROFILE_STARTUP"):
+        return None
+    profiler = StartupProfiler()
+    profiler.start()
+    return profiler
+
+
+def preload_heavy_modules():
+    """ Imports the lazily loaded modules now if CLINVIS_PRELOAD is set """
+    if os.environ.get("CLINVIS_PRELOAD"):
+        for name in HEAVY_MODULES:
+            importlib.import_module(name)